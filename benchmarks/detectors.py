@@ -0,0 +1,41 @@
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, ".")
+from py.anomaly_detection.detectors import detectors
+from py.anomaly_detection.lof import get_anomaly_bound
+from lof_scalable import make_days
+
+
+def fit(days, detector):
+    begin = time.time()
+    scores = detectors[detector](days, {"name": "benchmark"}, {}).decision_scores_
+    seconds = time.time() - begin
+    return (scores > get_anomaly_bound(scores)).astype(int), seconds
+
+
+if __name__ == "__main__":
+    # first fits include imports and compilation
+    for detector in detectors:
+        fit(make_days(50)[0], detector)
+
+    for years in [1, 4, 16]:
+        days, anomalies = make_days(261 * years)
+        lof_labels, lof_seconds = fit(days, "lof")
+        print(
+            f"{years} years, {len(days)} workdays: lof {lof_seconds:.2f}s, "
+            f"recall of injected anomalies {np.mean(lof_labels[anomalies]):.3f}"
+        )
+
+        for detector in detectors:
+            if detector == "lof":
+                continue
+            labels, seconds = fit(days, detector)
+            is_flagged = (labels == 1) | (lof_labels == 1)
+            print(
+                f"  {detector}: {seconds:.2f}s ({lof_seconds / seconds:.1f}x), "
+                f"label agreement {np.mean(labels == lof_labels):.3f}, "
+                f"anomaly agreement {np.mean(labels[is_flagged] == lof_labels[is_flagged]):.3f}, "
+                f"recall {np.mean(labels[anomalies]):.3f}"
+            )
@@ -0,0 +1,76 @@
+import sys
+import time
+import numpy as np
+
+sys.path.insert(0, ".")
+from py.anomaly_detection.lof import fit_lof, get_lof_arrays, update_lof
+from lof_scalable import make_days
+from pyod.models.lof import LOF
+
+
+def get_arrays(model, days):
+    arrays, parameters = get_lof_arrays(model, with_neighbors=True)
+    arrays["decision_scores"] = model.decision_scores_
+    arrays["training_days"] = days
+    return arrays, parameters
+
+
+def refit(arrays, parameters):
+    # lof refitted on all days of the updated model, in its projection
+    model = LOF(
+        contamination=np.nextafter(0, 1),
+        n_neighbors=parameters["n_neighbors"],
+        algorithm=parameters["algorithm"],
+        leaf_size=parameters["leaf_size"],
+        metric=parameters["metric"],
+        p=parameters["p"],
+    )
+    begin = time.time()
+    model.fit(arrays.get("fitted_days", arrays["training_days"]))
+    seconds = time.time() - begin
+
+    refitted, _ = get_lof_arrays(model, with_neighbors=True)
+    refitted["decision_scores"] = model.decision_scores_
+    return refitted, seconds
+
+
+if __name__ == "__main__":
+    configurations = [
+        {"mode": "scalable", "max_neighbors": 50},
+        {"mode": "scalable", "max_neighbors": 50, "pca_components": 16},
+    ]
+
+    for years in [4, 16]:
+        days, _ = make_days(261 * years + 5 * 8)
+        history, weeks = days[: 261 * years], days[261 * years :].reshape(8, 5, -1)
+        for lof_args in configurations:
+            arrays, parameters = get_arrays(
+                fit_lof(history, {"name": "benchmark"}, lof_args), history
+            )
+
+            update_seconds = 0
+            for week in weeks:
+                begin = time.time()
+                arrays = {**arrays, **update_lof(arrays, parameters, week)}
+                update_seconds += time.time() - begin
+                arrays["training_days"] = np.concatenate(
+                    [arrays["training_days"], week]
+                )
+
+            refitted, refit_seconds = refit(arrays, parameters)
+
+            for name in ["decision_scores", "k_distances", "lrd"]:
+                assert np.allclose(arrays[name], refitted[name], rtol=1e-9), name
+            assert np.array_equal(
+                np.sort(arrays["neighbors"], axis=1),
+                np.sort(refitted["neighbors"], axis=1),
+            )
+            score_difference = np.max(
+                np.abs(arrays["decision_scores"] - refitted["decision_scores"])
+            )
+            print(
+                f"{years} years + 8 weeks, {lof_args}: equal to a refit, "
+                f"max score difference {score_difference:.1e}, "
+                f"{update_seconds / len(weeks):.3f}s per weekly update, "
+                f"refit {refit_seconds:.3f}s"
+            )
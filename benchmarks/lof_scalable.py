@@ -0,0 +1,69 @@
+import sys
+import time
+import numpy as np
+
+from scipy.stats import spearmanr
+
+sys.path.insert(0, ".")
+from py.anomaly_detection.lof import fit_lof, get_anomaly_bound
+
+
+def make_days(n_days, periods_in_1_day=96, anomaly_share=0.03, seed=123):
+    # workday vectors with a morning and an evening peak, a yearly trend,
+    # day to day variation and a share of distorted days
+    rng = np.random.default_rng(seed)
+    hours = np.arange(periods_in_1_day) * 24 / periods_in_1_day
+    profile = 10 * np.exp(-((hours - 8) ** 2) / 2) + 8 * np.exp(
+        -((hours - 17) ** 2) / 3
+    )
+
+    yearly = 1 + 0.3 * np.sin(2 * np.pi * np.arange(n_days) / 261)
+    amplitude = yearly * rng.normal(1, 0.1, n_days)
+    days = amplitude[:, None] * profile + rng.normal(0, 1, (n_days, periods_in_1_day))
+
+    anomalies = rng.choice(n_days, int(anomaly_share * n_days), replace=False)
+    for day in anomalies:
+        shift = rng.integers(-12, 12)
+        days[day] = np.roll(days[day], shift) * rng.uniform(0.3, 2)
+
+    return np.clip(days, 0, None), anomalies
+
+
+def fit(days, lof_args):
+    begin = time.time()
+    scores = fit_lof(days, {"name": "benchmark"}, lof_args).decision_scores_
+    seconds = time.time() - begin
+    return scores, (scores > get_anomaly_bound(scores)).astype(int), seconds
+
+
+def get_top_overlap(exact_scores, scores, top):
+    # share of the days exact mode ranks highest found in the 2 * top highest
+    exact_top = np.argsort(-exact_scores)[:top]
+    return np.mean(np.isin(exact_top, np.argsort(-scores)[: 2 * top]))
+
+
+if __name__ == "__main__":
+    configurations = [
+        {"mode": "scalable", "max_neighbors": 50},
+        {"mode": "scalable", "max_neighbors": 50, "pca_components": 16},
+        {"mode": "scalable", "max_neighbors": 50, "pca_components": 8},
+        {"mode": "scalable", "max_neighbors": 100, "pca_components": 16},
+    ]
+
+    for years in [1, 4, 8, 16]:
+        days, anomalies = make_days(261 * years)
+        exact_scores, exact_labels, exact_seconds = fit(days, {})
+        print(
+            f"{years} years, {len(days)} workdays: exact {exact_seconds:.2f}s, "
+            f"recall of injected anomalies {np.mean(exact_labels[anomalies]):.3f}"
+        )
+
+        for lof_args in configurations:
+            scores, labels, seconds = fit(days, lof_args)
+            print(
+                f"  {lof_args}: {seconds:.2f}s ({exact_seconds / seconds:.1f}x), "
+                f"spearman {spearmanr(exact_scores, scores).correlation:.3f}, "
+                f"label agreement {np.mean(labels == exact_labels):.3f}, "
+                f"top overlap {get_top_overlap(exact_scores, scores, len(anomalies)):.3f}, "
+                f"recall {np.mean(labels[anomalies]):.3f}"
+            )
@@ -0,0 +1,165 @@
+import itertools
+import json
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from c8y_api.model import Measurement
+
+sys.path.insert(0, ".")
+from py.measurement_payload import iter_measurement_collection
+
+
+def make_results(n_periods, seed=123):
+    # analysed periods in UTC with the edge cases of the serialization:
+    # NaN, half-way rounding, tiny and huge scores
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2021-03-20", periods=n_periods, freq="15T", tz="UTC")
+    ts_df = pd.DataFrame(
+        {
+            "data": rng.poisson(20, n_periods).astype(float),
+            "imputed_data": rng.poisson(20, n_periods).astype(float),
+            "anomaly_label": rng.integers(0, 2, n_periods).astype(float),
+            "anomaly_score": rng.lognormal(0, 1, n_periods),
+            "sensor_error": rng.integers(0, 2, n_periods),
+        },
+        index=index,
+    )
+
+    ts_df.iloc[:50, ts_df.columns.get_loc("anomaly_score")] = np.nan
+    ts_df.iloc[50:62, ts_df.columns.get_loc("anomaly_score")] = [
+        1e-7,
+        5e-324,
+        -0.0,
+        0.1,
+        2.5,
+        3.0,
+        123456789.123,
+        1e16,
+        1e20,
+        1.7976931348623157e308,
+        -1e-300,
+        1 / 3,
+    ]
+    ts_df.iloc[62:73, ts_df.columns.get_loc("data")] = [
+        0.5,
+        1.5,
+        2.5,
+        -0.5,
+        -1.5,
+        7.49999,
+        7.5,
+        np.nan,
+        1e15,
+        0,
+        3,
+    ]
+    ts_df.iloc[73:78, ts_df.columns.get_loc("imputed_data")] = [
+        0.5,
+        1.5,
+        2.5,
+        3.5,
+        1e15,
+    ]
+    ts_df.iloc[78:83, ts_df.columns.get_loc("anomaly_label")] = np.nan
+    return ts_df
+
+
+def build_measurements(sensor, ts_df, upload_args):
+    # the payload of c8y_api Measurement objects of every row, as built before
+    # the measurement payload was written from whole columns
+    measurements = []
+    for index, row in ts_df.iterrows():
+        fragments = []
+        if upload_args["upload_anomaly_data"]:
+            c8y_Original = {
+                "Amount": {
+                    "unit": "n",
+                    "value": (
+                        int(np.round(row["data"])) if not np.isnan(row["data"]) else 0
+                    ),
+                },
+                "Anomaly Label": {
+                    "unit": "n",
+                    "value": (
+                        int(row["anomaly_label"])
+                        if not np.isnan(row["anomaly_label"])
+                        else 0
+                    ),
+                },
+                "Anomaly Score": {
+                    "unit": "n",
+                    "value": (
+                        float(row["anomaly_score"])
+                        if not np.isnan(row["anomaly_score"])
+                        else 0
+                    ),
+                },
+                "Sensor error or no observations": {
+                    "unit": "n",
+                    "value": int(row["sensor_error"]),
+                },
+            }
+            fragments.append({"c8y_Original": c8y_Original})
+        if upload_args["upload_imputation"]:
+            c8y_Imputed = {
+                "Amount": {"unit": "n", "value": int(np.round(row["imputed_data"]))}
+            }
+            fragments.append({"c8y_Imputed": c8y_Imputed, "c8y_ImputedData": {}})
+
+        if upload_args.get("combine_measurements"):
+            fragments = [{key: value for f in fragments for key, value in f.items()}]
+        for fragment in fragments:
+            measurements.append(
+                Measurement(
+                    type=upload_args["c8y_measurement_type"],
+                    source=sensor["target"],
+                    time=index.isoformat(),
+                    **fragment,
+                )
+            )
+
+    body = {"measurements": [measurement.to_json() for measurement in measurements]}
+    return json.dumps(body, allow_nan=False).encode("utf-8")
+
+
+if __name__ == "__main__":
+    sensor = {"name": "benchmark", "source": "1", "target": "42"}
+    ts_df = make_results(5000)
+    fractional_ts_df = make_results(100)
+    fractional_ts_df.index = fractional_ts_df.index + pd.to_timedelta(
+        np.arange(100) * 1500, unit="us"
+    )
+
+    for anomaly_data, imputation, combine in itertools.product([True, False], repeat=3):
+        if not (anomaly_data or imputation):
+            continue
+        upload_args = {
+            "upload_anomaly_data": anomaly_data,
+            "upload_imputation": imputation,
+            "combine_measurements": combine,
+            "c8y_measurement_type": "c8y_VehiclesMeasurement",
+        }
+        args = {"upload_to_c8y": upload_args}
+
+        for frame in [fractional_ts_df, ts_df.iloc[:0]]:
+            objects = build_measurements(sensor, frame, upload_args)
+            columns = b"".join(iter_measurement_collection(sensor, frame, args))
+            assert objects == columns, (upload_args, len(frame))
+
+        begin = time.time()
+        objects = build_measurements(sensor, ts_df, upload_args)
+        objects_seconds = time.time() - begin
+
+        begin = time.time()
+        columns = b"".join(iter_measurement_collection(sensor, ts_df, args))
+        columns_seconds = time.time() - begin
+
+        assert objects == columns, upload_args
+
+        print(
+            f"anomaly data {anomaly_data}, imputation {imputation}, combined {combine}: "
+            f"byte-identical, {len(ts_df)} rows in {objects_seconds:.2f}s with objects, "
+            f"{columns_seconds:.3f}s from columns"
+        )
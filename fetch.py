@@ -0,0 +1,6 @@
+from main import args
+from py.source_fetcher import fetch_device
+
+if __name__ == "__main__":
+    for device in args["data_loading"]["devices"]:
+        fetch_device(device["source"], args)
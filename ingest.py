@@ -0,0 +1,6 @@
+from main import args
+from py.event_store import ingest_device
+
+if __name__ == "__main__":
+    for device in args["data_loading"]["devices"]:
+        ingest_device(device["source"], args)
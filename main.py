@@ -21,21 +21,58 @@ args = {
         "base_url": target_auth["base_url"],
     },
     "devices_processed_in_parallel": 4,
+    "pipeline": {
+        "loading_threads": 2,
+        "persisting_threads": 2,
+        "queue_size": 2,
+    },
     "data_loading": {
         "start_date": "2019-06-01",
         "end_date": "2023-06-01",
         "directory": "data/files",
+        "cache_directory": "data/cache",
+        "event_store_directory": None,
+        "reader_threads": 4,
         "data_type": "EVENT",
+        "timezone": "Europe/Helsinki",
+        "event_frequency": "15Min",
+        "sensor_cache_file": "data/sensors.json",
+        "sensor_cache_ttl_hours": 24,
         "devices": [
             {"source": "123v1", "target": "123v2"},
             {"source": "456v1", "target": "456v2"},
         ],
     },
+    "fetch_from_c8y": {
+        "fetch_threads": 4,
+        "slice_days": 30,
+        "page_size": 2000,
+        "event_type": None,
+        "measurement_fragment": None,
+        "measurement_series": None,
+        "max_retries": 5,
+        "retry_backoff_seconds": 1.0,
+        "fetch_timeout_seconds": 60.0,
+    },
     "detect_anomalies": {
         "use_existing_model": False,
         "directory": "models",
+        "model_cache_size": 32,
+        "detector": "lof",
+        "lof": {
+            "mode": "exact",
+            "max_neighbors": 50,
+            "pca_components": 16,
+            "algorithm": "kd_tree",
+            "update": "refit",
+        },
+        "hbos": {"n_bins": 10},
+        "iforest": {"n_estimators": 100},
     },
     "impute_data_gaps": True,
+    "seasonality": {
+        "method": "mean",
+    },
     "plot": {
         "create_plot": True,
         "directory": "plots",
@@ -44,7 +81,18 @@ args = {
         "upload_anomaly_data": True,
         "upload_imputation": True,
         "batch_upload_size": 10000,
+        "min_batch_upload_size": 1000,
+        "max_batch_upload_size": 50000,
+        "target_upload_seconds": 10.0,
+        "upload_timeout_seconds": 60.0,
         "c8y_measurement_type": "c8y_VehiclesMeasurement",
+        "max_concurrent_uploads": 4,
+        "max_retries": 5,
+        "retry_backoff_seconds": 1.0,
+        "combine_measurements": False,
+        "gzip_payloads": False,
+        "journal_directory": "journal",
+        "fingerprint_directory": None,
     },
 }
 
@@ -1,6 +1,6 @@
 from sklearn.preprocessing import MinMaxScaler
-from ..preparer import is_last_sunday_of_march, is_last_sunday_of_october
-from .lof import lof
+from .detectors import detect, update_detector
+from .scoring import score_days
 import numpy as np
 import pandas as pd
 
@@ -11,67 +11,24 @@ march = 3
 october = 10
 
 
-def mark_missing_data(
-    ts_df, period_data, tumbled_days_df, tumbled_days_with_small_gaps_fixed_df
-):
-    idx_of_nans = np.any(np.isnan(tumbled_days_df), axis=1)
-    tumbled_days_df["sensor_error"] = 0
-    tumbled_days_df.loc[idx_of_nans, "sensor_error"] = 1
+def mark_missing_data(ts_df, day_grid, small_gaps_fixed_day_grid):
+    days_df = pd.DataFrame(index=day_grid.dates)
+    days_df["sensor_error"] = np.any(np.isnan(day_grid.values), axis=1).astype(int)
+    days_df["big_sensor_error"] = np.any(
+        np.isnan(small_gaps_fixed_day_grid.values), axis=1
+    ).astype(int)
 
-    idx_of_nans = np.any(np.isnan(tumbled_days_with_small_gaps_fixed_df), axis=1)
-    tumbled_days_df["big_sensor_error"] = 0
-    tumbled_days_df.loc[idx_of_nans, "big_sensor_error"] = 1
+    # expand labels
+    return day_grid.expand(days_df, ts_df)
 
-    periods_in_1_hour = period_data["periods_in_1_hour"]
-    periods_in_1_day = period_data["periods_in_1_day"]
-    periods_in_1_short_day = periods_in_1_day - periods_in_1_hour
-    periods_in_1_long_day = periods_in_1_day + periods_in_1_hour
 
-    # expand labels
-    expanded_sensor_errors = np.array([])
-    expanded_big_sensor_errors = np.array([])
-    for index, day in tumbled_days_df.iterrows():
-        if is_last_sunday_of_march(index):
-            expanded_sensor_errors = np.append(
-                expanded_sensor_errors,
-                np.repeat(day["sensor_error"], periods_in_1_short_day),
-            )
-            expanded_big_sensor_errors = np.append(
-                expanded_big_sensor_errors,
-                np.repeat(day["big_sensor_error"], periods_in_1_short_day),
-            )
-        elif is_last_sunday_of_october(index):
-            expanded_sensor_errors = np.append(
-                expanded_sensor_errors,
-                np.repeat(day["sensor_error"], periods_in_1_long_day),
-            )
-            expanded_big_sensor_errors = np.append(
-                expanded_big_sensor_errors,
-                np.repeat(day["big_sensor_error"], periods_in_1_long_day),
-            )
-        else:
-            expanded_sensor_errors = np.append(
-                expanded_sensor_errors, np.repeat(day["sensor_error"], periods_in_1_day)
-            )
-            expanded_big_sensor_errors = np.append(
-                expanded_big_sensor_errors,
-                np.repeat(day["big_sensor_error"], periods_in_1_day),
-            )
-
-    ts_df["sensor_error"] = expanded_sensor_errors
-    ts_df["big_sensor_error"] = expanded_big_sensor_errors
-    return ts_df
-
-
-def detect_anomalies(
-    ts_df, period_data, tumbled_workdays_df, tumbled_weekends_df, sensor, args
-):
+def detect_anomalies(ts_df, day_grid, sensor, args):
     tumbled_workdays_df = detect_anomalies_in_days(
-        tumbled_workdays_df, sensor, args, "workdays"
+        day_grid.workdays(), sensor, args, "workdays"
     )
 
     tumbled_weekends_df = detect_anomalies_in_days(
-        tumbled_weekends_df, sensor, args, "weekends"
+        day_grid.weekends(), sensor, args, "weekends"
     )
 
     # combine lof scores
@@ -88,40 +45,7 @@ def detect_anomalies(
         return ts_df
 
     # expand scores and labels
-    expanded_scores = np.array([])
-    expanded_labels = np.array([])
-
-    periods_in_1_hour = period_data["periods_in_1_hour"]
-    periods_in_1_day = period_data["periods_in_1_day"]
-    periods_in_1_short_day = periods_in_1_day - periods_in_1_hour
-    periods_in_1_long_day = periods_in_1_day + periods_in_1_hour
-    for index, day in tumbled_days_df.iterrows():
-        if is_last_sunday_of_march(index):
-            expanded_scores = np.append(
-                expanded_scores, np.repeat(day["anomaly_score"], periods_in_1_short_day)
-            )
-            expanded_labels = np.append(
-                expanded_labels, np.repeat(day["anomaly_label"], periods_in_1_short_day)
-            )
-        elif is_last_sunday_of_october(index):
-            expanded_scores = np.append(
-                expanded_scores, np.repeat(day["anomaly_score"], periods_in_1_long_day)
-            )
-            expanded_labels = np.append(
-                expanded_labels, np.repeat(day["anomaly_label"], periods_in_1_long_day)
-            )
-        else:
-            expanded_scores = np.append(
-                expanded_scores, np.repeat(day["anomaly_score"], periods_in_1_day)
-            )
-            expanded_labels = np.append(
-                expanded_labels, np.repeat(day["anomaly_label"], periods_in_1_day)
-            )
-
-    ts_df["anomaly_score"] = expanded_scores
-    ts_df["anomaly_label"] = expanded_labels
-
-    return ts_df
+    return day_grid.expand(tumbled_days_df[["anomaly_score", "anomaly_label"]], ts_df)
 
 
 def detect_anomalies_in_days(tumbled_days_df, sensor, args, data_type):
@@ -131,12 +55,11 @@ def detect_anomalies_in_days(tumbled_days_df, sensor, args, data_type):
     non_nans = tumbled_days_df[idx_of_no_nans]
 
     if len(non_nans) > 1 or (use_existing_model and len(non_nans) != 0):
-        tumbled_days_df = pd.DataFrame(
-            MinMaxScaler().fit_transform(tumbled_days_df),
-            columns=tumbled_days_df.columns,
-            index=tumbled_days_df.index,
-        )
-        scores, labels = lof(non_nans, sensor, args, data_type)
+        if use_existing_model:
+            scores, labels = score_days(non_nans, sensor, args, data_type)
+        else:
+            updated = update_detector(non_nans, sensor, args, data_type)
+            scores, labels = updated or fit_days(non_nans, sensor, args, data_type)
 
         tumbled_days_df["anomaly_score"] = np.nan
         tumbled_days_df["anomaly_label"] = np.nan
@@ -145,3 +68,12 @@ def detect_anomalies_in_days(tumbled_days_df, sensor, args, data_type):
         tumbled_days_df["anomaly_label"][np.where(idx_of_no_nans)[0]] = labels
 
     return tumbled_days_df
+
+
+def fit_days(days, sensor, args, data_type):
+    # the model is fitted on scaled days, the scaler is stored with it
+    scaler = MinMaxScaler().fit(days)
+    scaled_days = pd.DataFrame(
+        scaler.transform(days), columns=days.columns, index=days.index
+    )
+    return detect(scaled_days, sensor, args, data_type, scaler)
@@ -0,0 +1,231 @@
+import json
+import os
+import numpy as np
+
+from pyod.models.copod import COPOD
+from pyod.models.ecod import ECOD
+from pyod.models.hbos import HBOS
+from pyod.models.iforest import IForest
+
+from .lof import (
+    CustomParameters,
+    ProjectedModel,
+    StoredLOF,
+    fit_lof,
+    get_anomaly_bound,
+    get_lof_arrays,
+    get_n_neighbors,
+    set_random_state,
+    update_lof,
+)
+from .model_store import (
+    get_data_hash,
+    get_training_range,
+    load_legacy_model,
+    load_model,
+    save_model,
+)
+
+
+def fit_ecod(data, sensor, detector_args):
+    return ECOD(contamination=np.nextafter(0, 1)).fit(data)
+
+
+def fit_copod(data, sensor, detector_args):
+    return COPOD(contamination=np.nextafter(0, 1)).fit(data)
+
+
+def fit_hbos(data, sensor, detector_args):
+    return HBOS(
+        contamination=np.nextafter(0, 1), n_bins=detector_args.get("n_bins") or 10
+    ).fit(data)
+
+
+def fit_iforest(data, sensor, detector_args):
+    customParameters = CustomParameters()
+    set_random_state(customParameters)
+
+    return IForest(
+        contamination=np.nextafter(0, 1),
+        n_estimators=detector_args.get("n_estimators") or 100,
+        random_state=customParameters.random_state,
+    ).fit(data)
+
+
+# fit functions by detector name, every fit returns a fitted pyod style model
+# with decision_scores_ of the training days and decision_function(days)
+detectors = {
+    "lof": fit_lof,
+    "ecod": fit_ecod,
+    "copod": fit_copod,
+    "hbos": fit_hbos,
+    "iforest": fit_iforest,
+}
+
+
+def get_model_path(sensor, args, data_type):
+    ad_args = args["detect_anomalies"]
+    detector = ad_args.get("detector") or "lof"
+    if detector not in detectors:
+        raise ValueError(f"Unknown anomaly detector {detector}. Exiting.")
+
+    model_dir = ad_args["directory"] or "models"
+    # lof models keep their original file name
+    model_name = data_type if detector == "lof" else f"{data_type}.{detector}"
+    return f'{model_dir}/{sensor["source"]}.{model_name}', detector
+
+
+def detect(data, sensor, args, data_type, scaler=None):
+    path, detector = get_model_path(sensor, args, data_type)
+    model_dir = os.path.dirname(path)
+    if not os.path.isdir(model_dir):
+        os.mkdir(model_dir)
+
+    detector_args = args["detect_anomalies"].get(detector) or {}
+    model = detectors[detector](data, sensor, detector_args)
+
+    save_detector(path, model, data, detector, detector_args, scaler)
+    scores = model.decision_scores_
+
+    anomaly_bound = get_anomaly_bound(scores)
+    labels = (scores > anomaly_bound).astype(int)
+
+    return scores, labels
+
+
+def update_detector(data, sensor, args, data_type):
+    # scores and labels after appending the days that are new since the
+    # stored lof was fitted, None if the model has to be refitted instead
+    path, detector = get_model_path(sensor, args, data_type)
+    lof_args = args["detect_anomalies"].get("lof") or {}
+    if detector != "lof" or lof_args.get("update") != "incremental":
+        return None
+
+    stored = load_model(path)
+    if stored is None:
+        return None
+    header, arrays = stored
+
+    reason = None
+    if (
+        header["version"] < 2
+        or "neighbors" not in arrays
+        or "scaler_scale" not in arrays
+    ):
+        reason = "it was fitted without incremental updates"
+    elif header["parameters"] != json.loads(json.dumps(lof_args)):
+        reason = "its settings changed"
+    else:
+        # the days are scaled like the days the model was fitted on
+        days = np.asarray(data, dtype=float) * arrays["scaler_scale"]
+        days += arrays["scaler_min"]
+        dates = np.array(data.index, dtype="datetime64[D]")
+        training_dates = arrays["training_dates"]
+
+        positions = np.searchsorted(training_dates, dates)
+        positions = np.minimum(positions, len(training_dates) - 1)
+        is_trained = training_dates[positions] == dates
+        is_new = ~is_trained
+        is_changed = is_trained & np.any(
+            arrays["training_days"][positions] != days, axis=1
+        )
+        n_days = len(training_dates) + np.count_nonzero(is_new)
+        if np.any(is_new) and dates[is_new][0] <= training_dates[-1]:
+            reason = "days older than its last day were added"
+        elif get_n_neighbors(n_days, lof_args) != header["lof"]["n_neighbors"]:
+            reason = "its number of neighbours changes"
+
+    if reason is not None:
+        print(f'{sensor["name"]}: Refitting the {data_type} model, {reason}')
+        return None
+
+    if np.any(is_new):
+        arrays = {
+            **arrays,
+            **update_lof(arrays, header["lof"], days[is_new]),
+            "training_days": np.concatenate([arrays["training_days"], days[is_new]]),
+            "training_dates": np.concatenate([training_dates, dates[is_new]]),
+        }
+        header = {
+            **header,
+            "training_end": data.index[-1].isoformat(),
+            "data_hash": get_data_hash(arrays["training_days"]),
+        }
+        save_model(path, header, arrays)
+        print(
+            f'{sensor["name"]}: Added {np.count_nonzero(is_new)} days to the {data_type} model'
+        )
+
+    positions = np.searchsorted(arrays["training_dates"], dates)
+    scores = arrays["decision_scores"][positions]
+    if np.any(is_changed):
+        # the stored days stay as they were added, days whose values changed
+        # since are scored like by an existing model
+        scores[is_changed] = StoredLOF(arrays, header["lof"]).decision_function(
+            days[is_changed]
+        )
+
+    anomaly_bound = get_anomaly_bound(arrays["decision_scores"])
+    labels = (scores > anomaly_bound).astype(int)
+
+    return scores, labels
+
+
+def save_detector(path, model, data, detector, detector_args, scaler=None):
+    training_start, training_end = get_training_range(data)
+    header = {
+        "detector": detector,
+        "parameters": detector_args,
+        "training_start": training_start,
+        "training_end": training_end,
+        "data_hash": None if data is None else get_data_hash(data),
+    }
+    arrays = {"decision_scores": model.decision_scores_}
+    if data is not None:
+        arrays["training_days"] = np.asarray(data, dtype=float)
+    if hasattr(data, "index"):
+        arrays["training_dates"] = np.array(data.index, dtype="datetime64[D]")
+    if scaler is not None:
+        arrays["scaler_min"] = scaler.min_
+        arrays["scaler_scale"] = scaler.scale_
+    if detector == "lof":
+        lof_arrays, header["lof"] = get_lof_arrays(
+            model, detector_args.get("update") == "incremental"
+        )
+        if data is not None and "projection_components" not in lof_arrays:
+            # lof was fitted on the training days themselves
+            del lof_arrays["fitted_days"]
+        arrays.update(lof_arrays)
+
+    save_model(path, header, arrays)
+
+
+def load_detector(path, sensor, detector):
+    # (model, header, arrays), header and arrays are None for legacy models
+    # that are used as they are
+    stored = load_model(path)
+    if stored is None:
+        legacy_model = load_legacy_model(path)
+        if legacy_model is None:
+            raise FileNotFoundError(f"No model {path}.npz to score with. Exiting.")
+        if detector != "lof":
+            return legacy_model, None, None
+
+        print(f'{sensor["name"]}: Migrating model {path}.pickle to {path}.npz')
+        # the days of projected legacy models are only kept projected
+        data = None
+        if not isinstance(legacy_model, ProjectedModel):
+            data = legacy_model.detector_._fit_X
+        save_detector(path, legacy_model, data, detector, {})
+        stored = load_model(path)
+
+    header, arrays = stored
+    if header["detector"] == "lof":
+        return StoredLOF(arrays, header["lof"]), header, arrays
+
+    # the state of the other detectors is refitted from the stored days,
+    # their fits are deterministic
+    model = detectors[header["detector"]](
+        arrays["training_days"], sensor, header["parameters"]
+    )
+    return model, header, arrays
@@ -1,9 +1,9 @@
-import os
-import pickle
 import numpy as np
 
 from dataclasses import dataclass
 from pyod.models.lof import LOF
+from sklearn.decomposition import PCA
+from sklearn.neighbors import NearestNeighbors
 
 import logging
 
@@ -29,57 +29,230 @@ def set_random_state(customParameters: CustomParameters) -> None:
     np.random.seed(seed)
 
 
-def lof(data, sensor, args, data_type):
-    ad_args = args["detect_anomalies"]
-    model_dir = ad_args["directory"] or "models"
-    if not os.path.isdir(model_dir):
-        os.mkdir(model_dir)
+def get_n_neighbors(n_days, lof_args):
+    n_neighbors = int(np.ceil(0.3 * n_days))
+    if lof_args.get("mode") == "scalable":
+        n_neighbors = min(n_neighbors, lof_args.get("max_neighbors") or 50)
+    return n_neighbors
 
-    filename = f'{model_dir}/{sensor["source"]}.{data_type}.pickle'
 
-    if ad_args["use_existing_model"]:
-        with open(filename, "rb") as file:
-            model = pickle.load(file)
+def fit_lof(data, sensor, lof_args):
+    n_neighbors = get_n_neighbors(len(data), lof_args)
+    algorithm = CustomParameters.algorithm
 
-        new_scores = model.decision_function(data)
-        previous_scores = model.decision_scores_
+    # scalable mode bounds the neighbourhood size and the dimensions of the
+    # day vectors, so the cost stops growing with the length of the history
+    is_scalable = lof_args.get("mode") == "scalable"
+    if is_scalable:
+        algorithm = lof_args.get("algorithm") or "kd_tree"
 
-        anomaly_bound = get_anomaly_bound(previous_scores)
-        new_labels = (new_scores > anomaly_bound).astype(int)
+    logging.info(
+        f"{sensor['name']}: Detecting anomalies with lof using {n_neighbors} for n_neighbors"
+    )
 
-        return new_scores, new_labels
+    customParameters = CustomParameters(n_neighbors=n_neighbors, algorithm=algorithm)
 
-    else:
-        n_neighbors = int(np.ceil(0.3 * len(data)))
+    set_random_state(customParameters)
 
-        logging.info(
-            f"{sensor['name']}: Detecting anomalies with lof using {n_neighbors} for n_neighbors"
+    model = LOF(
+        contamination=np.nextafter(0, 1),
+        n_neighbors=customParameters.n_neighbors,
+        leaf_size=customParameters.leaf_size,
+        n_jobs=customParameters.n_jobs,
+        algorithm=customParameters.algorithm,
+        metric=customParameters.distance_metric,
+        metric_params=None,
+        p=customParameters.distance_metric_order,
+    )
+
+    n_components = lof_args.get("pca_components") if is_scalable else None
+    if not n_components:
+        model.fit(data)
+        return model
+
+    n_components = min(n_components, *np.shape(data))
+    projected_model = ProjectedModel(
+        PCA(n_components=n_components, random_state=customParameters.random_state),
+        model,
+    )
+    projected_model.fit(data)
+    return projected_model
+
+
+@dataclass
+class ProjectedModel:
+    # detector fitted on the day vectors projected to their principal components
+    projection: PCA
+    model: LOF
+
+    def fit(self, data):
+        self.model.fit(self.projection.fit_transform(data))
+        return self
+
+    def decision_function(self, data):
+        return self.model.decision_function(self.projection.transform(data))
+
+    @property
+    def decision_scores_(self):
+        return self.model.decision_scores_
+
+
+def get_lof_arrays(model, with_neighbors=False):
+    # what scoring needs of a fitted lof: the fitted day vectors, their
+    # k-distances and local reachability densities, and the projection.
+    # Updating it also needs the neighbours of the fitted days
+    arrays = {}
+    if isinstance(model, ProjectedModel):
+        arrays["projection_mean"] = model.projection.mean_
+        arrays["projection_components"] = model.projection.components_
+        model = model.model
+
+    detector = model.detector_
+    arrays["fitted_days"] = detector._fit_X
+    arrays["k_distances"] = detector._distances_fit_X_[:, detector.n_neighbors_ - 1]
+    arrays["lrd"] = detector._lrd
+    if with_neighbors:
+        # sklearn does not keep the neighbours of the fitted days
+        arrays["neighbor_distances"], arrays["neighbors"] = detector.kneighbors(
+            n_neighbors=detector.n_neighbors_
         )
 
-        customParameters = CustomParameters(n_neighbors=n_neighbors)
+    parameters = {
+        "n_neighbors": int(detector.n_neighbors_),
+        "algorithm": detector._fit_method,
+        "leaf_size": model.leaf_size,
+        "metric": model.metric,
+        "p": model.p,
+    }
+    return arrays, parameters
+
+
+class StoredLOF:
+    # scores days like the fitted pyod LOF, from the stored arrays only
+    def __init__(self, arrays, parameters):
+        self.arrays = arrays
+        self.parameters = parameters
+        self.index = None
 
-        set_random_state(customParameters)
+    @property
+    def decision_scores_(self):
+        return self.arrays["decision_scores"]
 
-        model = LOF(
-            contamination=np.nextafter(0, 1),
-            n_neighbors=customParameters.n_neighbors,
-            leaf_size=customParameters.leaf_size,
-            n_jobs=customParameters.n_jobs,
-            algorithm=customParameters.algorithm,
-            metric=customParameters.distance_metric,
-            metric_params=None,
-            p=customParameters.distance_metric_order,
+    def get_fitted_days(self):
+        if "fitted_days" in self.arrays:
+            return self.arrays["fitted_days"]
+        return self.arrays["training_days"]
+
+    def decision_function(self, data):
+        days = np.asarray(data, dtype=float)
+        if "projection_components" in self.arrays:
+            days = np.dot(
+                days - self.arrays["projection_mean"],
+                self.arrays["projection_components"].T,
+            )
+
+        if self.index is None:
+            self.index = get_nearest_neighbors(self.parameters).fit(
+                self.get_fitted_days()
+            )
+        distances, neighbors = self.index.kneighbors(days)
+
+        reach_distances = np.maximum(distances, self.arrays["k_distances"][neighbors])
+        days_lrd = 1.0 / (np.mean(reach_distances, axis=1) + 1e-10)
+        return np.mean(self.arrays["lrd"][neighbors] / days_lrd[:, np.newaxis], axis=1)
+
+
+def get_nearest_neighbors(parameters):
+    return NearestNeighbors(
+        n_neighbors=parameters["n_neighbors"],
+        algorithm=parameters["algorithm"],
+        leaf_size=parameters["leaf_size"],
+        metric=parameters["metric"],
+        p=parameters["p"],
+    )
+
+
+def update_lof(arrays, parameters, new_days):
+    # appends days to a stored lof like a refit on all days would see them,
+    # only the neighbourhoods the new days enter are searched again and only
+    # the densities and scores depending on them are recomputed
+    new_days = np.asarray(new_days, dtype=float)
+    is_projected = "projection_components" in arrays
+    if is_projected:
+        new_days = np.dot(
+            new_days - arrays["projection_mean"], arrays["projection_components"].T
         )
-        model.fit(data)
+    fitted_days = arrays.get("fitted_days", arrays["training_days"])
+    fitted_days = np.concatenate([fitted_days, new_days])
+
+    n_neighbors = parameters["n_neighbors"]
+    n_stored = len(arrays["lrd"])
+    new = np.arange(n_stored, len(fitted_days))
+
+    # stored days get new neighbours if a new day is within their k-distance
+    distances_to_new, _ = (
+        get_nearest_neighbors(parameters)
+        .fit(new_days)
+        .kneighbors(fitted_days[:n_stored], 1)
+    )
+    is_entered = distances_to_new[:, 0] <= arrays["k_distances"]
+    searched = np.concatenate([np.flatnonzero(is_entered), new])
+
+    neighbors = np.concatenate(
+        [arrays["neighbors"], np.zeros((len(new), n_neighbors), dtype=int)]
+    )
+    neighbor_distances = np.concatenate(
+        [arrays["neighbor_distances"], np.zeros((len(new), n_neighbors))]
+    )
+    index = get_nearest_neighbors(parameters).fit(fitted_days)
+    neighbor_distances[searched], neighbors[searched] = get_neighbors_of_fitted(
+        index, fitted_days, searched, n_neighbors
+    )
+    k_distances = neighbor_distances[:, n_neighbors - 1]
+
+    # densities depend on the k-distances of the neighbours, scores on the
+    # densities of the neighbours
+    lrd = np.concatenate([arrays["lrd"], np.zeros(len(new))])
+    recomputed = np.union1d(
+        searched, np.flatnonzero(np.isin(neighbors, searched).any(1))
+    )
+    reach_distances = np.maximum(
+        neighbor_distances[recomputed], k_distances[neighbors[recomputed]]
+    )
+    lrd[recomputed] = 1.0 / (np.mean(reach_distances, axis=1) + 1e-10)
+
+    scores = np.concatenate([arrays["decision_scores"], np.zeros(len(new))])
+    rescored = np.union1d(
+        recomputed, np.flatnonzero(np.isin(neighbors, recomputed).any(1))
+    )
+    scores[rescored] = np.mean(
+        lrd[neighbors[rescored]] / lrd[rescored, np.newaxis], axis=1
+    )
 
-        with open(filename, "wb") as file:
-            pickle.dump(model, file)
-        scores = model.decision_scores_
+    updated = {
+        "decision_scores": scores,
+        "k_distances": k_distances,
+        "lrd": lrd,
+        "neighbors": neighbors,
+        "neighbor_distances": neighbor_distances,
+    }
+    if "fitted_days" in arrays:
+        updated["fitted_days"] = fitted_days
+    return updated
 
-        anomaly_bound = get_anomaly_bound(scores)
-        labels = (scores > anomaly_bound).astype(int)
 
-        return scores, labels
+def get_neighbors_of_fitted(index, fitted_days, positions, n_neighbors):
+    # neighbours of fitted days without the day itself, like sklearn's
+    # kneighbors() of the fitted days
+    distances, neighbors = index.kneighbors(fitted_days[positions], n_neighbors + 1)
+    is_other = neighbors != positions[:, np.newaxis]
+    # a day with more duplicates than neighbours may not be listed, then the
+    # first duplicate is dropped
+    is_other[np.all(is_other, axis=1), 0] = False
+    return (
+        distances[is_other].reshape(len(positions), n_neighbors),
+        neighbors[is_other].reshape(len(positions), n_neighbors),
+    )
 
 
 def get_anomaly_bound(scores):
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import pickle
+import struct
+import time
+import zipfile
+import numpy as np
+
+# version of the stored model layout, older versions stay readable.
+# 2: detectors are fitted on the days scaled by the stored scaler
+model_format_version = 2
+
+zip_local_header = struct.Struct("<4s5H3L2H")
+
+
+def get_data_hash(data):
+    return hashlib.sha1(np.ascontiguousarray(data, dtype=float).tobytes()).hexdigest()
+
+
+def get_training_range(data):
+    index = getattr(data, "index", None)
+    if index is None or len(index) == 0 or not hasattr(index[0], "isoformat"):
+        return None, None
+    return index[0].isoformat(), index[-1].isoformat()
+
+
+def save_model(path, header, arrays):
+    # header and arrays in one uncompressed npz, so the arrays can be mapped
+    header = {"version": model_format_version, "created": time.time(), **header}
+    with open(f"{path}.npz.tmp", "wb") as file:
+        np.savez(file, header=np.array(json.dumps(header)), **arrays)
+    os.replace(f"{path}.npz.tmp", f"{path}.npz")
+
+
+def load_model(path):
+    # (header, arrays) of a stored model, None if there is none
+    filename = f"{path}.npz"
+    if not os.path.isfile(filename):
+        return None
+
+    arrays = load_npz(filename)
+    header = json.loads(str(arrays.pop("header")))
+    if header["version"] > model_format_version:
+        raise ValueError(
+            f"Model {filename} has version {header['version']}, newer than {model_format_version}. Exiting."
+        )
+
+    return header, arrays
+
+
+def load_legacy_model(path):
+    # pickled pyod model of earlier versions
+    filename = f"{path}.pickle"
+    if not os.path.isfile(filename):
+        return None
+
+    with open(filename, "rb") as file:
+        return pickle.load(file)
+
+
+def load_npz(filename):
+    # arrays of an uncompressed npz are memory-mapped instead of read
+    arrays = {}
+    with zipfile.ZipFile(filename) as archive, open(filename, "rb") as file:
+        for info in archive.infolist():
+            name = info.filename[: -len(".npy")]
+            with archive.open(info) as member:
+                version = np.lib.format.read_magic(member)
+                if version == (1, 0):
+                    header = np.lib.format.read_array_header_1_0(member)
+                else:
+                    header = np.lib.format.read_array_header_2_0(member)
+                shape, fortran_order, dtype = header
+                array_offset = member.tell()
+
+            size = int(np.prod(shape))
+            if (
+                info.compress_type != zipfile.ZIP_STORED
+                or dtype.hasobject
+                or size == 0
+                or shape == ()
+            ):
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+
+            file.seek(info.header_offset)
+            local_header = zip_local_header.unpack(file.read(zip_local_header.size))
+            filename_length, extra_length = local_header[-2:]
+            member_offset = (
+                info.header_offset
+                + zip_local_header.size
+                + filename_length
+                + extra_length
+            )
+            arrays[name] = np.memmap(
+                filename,
+                dtype=dtype,
+                mode="r",
+                shape=shape,
+                order="F" if fortran_order else "C",
+                offset=member_offset + array_offset,
+            )
+
+    return arrays
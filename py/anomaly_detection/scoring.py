@@ -0,0 +1,112 @@
+import os
+import threading
+import numpy as np
+
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from .detectors import get_model_path, load_detector
+from .lof import get_anomaly_bound
+
+# loaded models by path, one cache per analysis process, shared by its threads
+model_cache = OrderedDict()
+model_cache_lock = threading.Lock()
+
+
+@dataclass
+class ScoringModel:
+    # a stored model with everything scoring needs, kept warm between calls
+    model: object
+    anomaly_bound: float
+    scaler_min: np.ndarray = None
+    scaler_scale: np.ndarray = None
+    training_dates: np.ndarray = None
+    training_days: np.ndarray = None
+    training_scores: np.ndarray = None
+
+    def scale(self, days):
+        if self.scaler_scale is None:
+            return days
+        return days * self.scaler_scale + self.scaler_min
+
+    def score(self, days):
+        values = self.scale(np.asarray(days, dtype=float))
+
+        # training days keep their training scores, the others are scored
+        # in one batch
+        scores = np.full(len(values), np.nan)
+        positions, is_trained = self.find_training_days(days.index, values)
+        if np.any(is_trained):
+            scores[is_trained] = self.training_scores[positions[is_trained]]
+        if not np.all(is_trained):
+            scores[~is_trained] = self.model.decision_function(values[~is_trained])
+
+        labels = (scores > self.anomaly_bound).astype(int)
+        return scores, labels
+
+    def find_training_days(self, index, values):
+        # positions of the unchanged training days among the days
+        if self.training_dates is None or len(self.training_dates) == 0:
+            return np.zeros(len(values), dtype=int), np.zeros(len(values), dtype=bool)
+
+        dates = np.array(index, dtype="datetime64[D]")
+        positions = np.searchsorted(self.training_dates, dates)
+        positions = np.minimum(positions, len(self.training_dates) - 1)
+        is_trained = (self.training_dates[positions] == dates) & np.all(
+            self.training_days[positions] == values, axis=1
+        )
+        return positions, is_trained
+
+
+def score_days(days, sensor, args, data_type):
+    return get_scoring_model(sensor, args, data_type).score(days)
+
+
+def get_scoring_model(sensor, args, data_type):
+    path, detector = get_model_path(sensor, args, data_type)
+    cache_size = args["detect_anomalies"].get("model_cache_size") or 32
+
+    with model_cache_lock:
+        cached = model_cache.get(path)
+        if cached is not None and cached[0] == get_model_version(path):
+            model_cache.move_to_end(path)
+            return cached[1]
+
+    scoring_model = load_scoring_model(path, sensor, detector)
+    # a legacy model is migrated while loading, so its version is taken after
+    version = get_model_version(path)
+
+    with model_cache_lock:
+        model_cache[path] = (version, scoring_model)
+        model_cache.move_to_end(path)
+        while len(model_cache) > cache_size:
+            model_cache.popitem(last=False)
+
+    return scoring_model
+
+
+def get_model_version(path):
+    # a retrained model replaces the file, which invalidates the cached one
+    for filename in [f"{path}.npz", f"{path}.pickle"]:
+        if os.path.isfile(filename):
+            stat = os.stat(filename)
+            return filename, stat.st_mtime_ns, stat.st_size
+    return None
+
+
+def load_scoring_model(path, sensor, detector):
+    model, header, arrays = load_detector(path, sensor, detector)
+    if header is None:
+        return ScoringModel(model, get_anomaly_bound(model.decision_scores_))
+
+    scoring_model = ScoringModel(model, get_anomaly_bound(arrays["decision_scores"]))
+    # models of version 1 were fitted on unscaled days
+    if header["version"] >= 2 and "scaler_scale" in arrays:
+        scoring_model.scaler_min = arrays["scaler_min"]
+        scoring_model.scaler_scale = arrays["scaler_scale"]
+    if "training_dates" in arrays:
+        scoring_model.training_dates = arrays["training_dates"]
+        scoring_model.training_days = arrays["training_days"]
+        scoring_model.training_scores = arrays["decision_scores"]
+
+    return scoring_model
@@ -0,0 +1,59 @@
+import time
+
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError, Timeout
+
+from c8y_api import CumulocityRestApi
+
+
+def get_connection(auth, pool_size=1):
+    c8y = CumulocityRestApi(
+        username=auth["username"],
+        password=auth["password"],
+        tenant_id=auth["tenant_id"],
+        base_url=auth["base_url"],
+    )
+    # keep a connection open for every concurrent request
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+    c8y.session.mount("http://", adapter)
+    c8y.session.mount("https://", adapter)
+    return c8y
+
+
+def send_with_retries(send, action, max_retries, backoff_seconds, on_retry=None):
+    # send() is retried after a 429 or 5xx response or a connection error,
+    # action names the request in messages, e.g. "upload measurements"
+    for attempt in range(max_retries + 1):
+        try:
+            response = send()
+        except (ConnectionError, Timeout) as exception:
+            if attempt == max_retries:
+                raise
+            print(f"Failed to {action} with {exception!r}, retrying")
+            if on_retry:
+                on_retry()
+            wait_before_retry(backoff_seconds, attempt, None)
+            continue
+
+        if response.status_code in (200, 201):
+            return response
+
+        is_retryable = response.status_code == 429 or response.status_code >= 500
+        if not is_retryable or attempt == max_retries:
+            raise ValueError(
+                f"Unable to {action}. Status: {response.status_code} Response:\n"
+                + response.text
+            )
+
+        print(f"Failed to {action} with status {response.status_code}, retrying")
+        if on_retry:
+            on_retry()
+        wait_before_retry(backoff_seconds, attempt, response.headers.get("Retry-After"))
+
+
+def wait_before_retry(backoff_seconds, attempt, retry_after):
+    # exponential backoff, unless the server tells how long to wait
+    seconds = backoff_seconds * 2**attempt
+    if retry_after is not None and retry_after.isdigit():
+        seconds = max(seconds, int(retry_after))
+    time.sleep(seconds)
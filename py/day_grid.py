@@ -0,0 +1,129 @@
+import dataclasses
+import numpy as np
+import pandas as pd
+
+from dataclasses import dataclass
+
+from .dst_calendar import DstCalendar
+from .preparer import friday
+
+
+@dataclass
+class DayGrid:
+    # days x periods_in_1_day, daylight saving days are normalized to a regular day
+    values: np.ndarray
+    dst_calendar: DstCalendar
+    dates: pd.Index
+    is_weekend: np.ndarray
+    period_data: dict
+
+    @classmethod
+    def from_series(cls, series, period_data, dst_calendar):
+        if len(series) != dst_calendar.day_lengths.sum():
+            raise ValueError(
+                "Time series does not cover the days of the calendar. Exiting."
+            )
+
+        day_starts = dst_calendar.day_starts
+
+        return cls(
+            values=to_day_matrix(series.values, dst_calendar, period_data),
+            dst_calendar=dst_calendar,
+            dates=pd.Index(day_starts.date),
+            is_weekend=day_starts.weekday > friday,
+            period_data=period_data,
+        )
+
+    @property
+    def day_lengths(self):
+        # amount of periods every day has in the flat time series
+        return self.dst_calendar.day_lengths
+
+    @property
+    def is_workday(self):
+        return ~self.is_weekend
+
+    def refill(self, series):
+        # same days, new values
+        return dataclasses.replace(
+            self,
+            values=to_day_matrix(series.values, self.dst_calendar, self.period_data),
+        )
+
+    def slot_mask(self, day_mask):
+        # expand a mask over days to a mask over the flat time series
+        return self.dst_calendar.period_mask(day_mask)
+
+    def expand(self, days_df, ts_df):
+        # broadcast every per-day column to all periods of the day at once
+        expanded = np.repeat(days_df.values, self.day_lengths, axis=0)
+        for i, column in enumerate(days_df.columns):
+            ts_df[column] = expanded[:, i]
+
+        return ts_df
+
+    def tile(self, day_profile, day_mask):
+        # repeat the profile of a regular day over every period of the masked days
+        periods_in_1_day = self.period_data["periods_in_1_day"]
+        period_columns = self.dst_calendar.get_period_columns(periods_in_1_day)
+        period_columns = period_columns[self.slot_mask(day_mask)]
+
+        return np.where(period_columns >= 0, day_profile[period_columns], 0)
+
+    def frame(self, day_mask=None):
+        if day_mask is None:
+            day_mask = np.full(len(self.dates), True)
+
+        periods_in_1_day = self.period_data["periods_in_1_day"]
+        columns = [f"value{period+1}" for period in range(periods_in_1_day)]
+
+        return pd.DataFrame(
+            self.values[day_mask], index=self.dates[day_mask], columns=columns
+        )
+
+    def workdays(self):
+        return self.frame(self.is_workday)
+
+    def weekends(self):
+        return self.frame(self.is_weekend)
+
+
+def to_day_matrix(flat_values, dst_calendar, period_data):
+    periods_in_1_day = period_data["periods_in_1_day"]
+    day_lengths = dst_calendar.day_lengths
+
+    flat_values = np.asarray(flat_values, dtype=float)
+    day_starts = np.append(0, np.cumsum(day_lengths)[:-1])
+
+    matrix = np.empty((len(day_lengths), periods_in_1_day))
+
+    is_regular_day = day_lengths == periods_in_1_day
+    matrix[is_regular_day] = flat_values[
+        day_starts[is_regular_day, None] + np.arange(periods_in_1_day)
+    ]
+
+    # append or remove periods in respect to daylight savings day
+    for day, transition_period, shift in zip(
+        dst_calendar.transition_days,
+        dst_calendar.transition_periods,
+        dst_calendar.transition_shifts,
+    ):
+        day_start = day_starts[day]
+        day_values = flat_values[day_start : day_start + day_lengths[day]]
+
+        if shift < 0:
+            # Add dummy periods in place of the skipped ones
+            matrix[day] = np.insert(day_values, transition_period, np.repeat(0, -shift))
+        else:
+            # Reduce the repeated periods into 1
+            repeated_end = transition_period + 2 * shift
+            repeated_periods = day_values[transition_period:repeated_end]
+            matrix[day] = np.concatenate(
+                [
+                    day_values[:transition_period],
+                    repeated_periods.reshape(2, shift).sum(axis=0),
+                    day_values[repeated_end:],
+                ]
+            )
+
+    return matrix
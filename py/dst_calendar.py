@@ -0,0 +1,156 @@
+import numpy as np
+import pandas as pd
+
+from dataclasses import dataclass
+
+nanos_in_1_day = 24 * 3600 * 1_000_000_000
+
+
+@dataclass
+class DstCalendar:
+    # local midnights of every day in the date range
+    day_starts: pd.DatetimeIndex
+    # amount of periods every day has, shorter or longer on daylight saving days
+    day_lengths: np.ndarray
+    # first period after every change of the UTC offset
+    transitions: pd.DatetimeIndex
+    transition_days: np.ndarray
+    # period of the (regular) day where the skipped or repeated periods start
+    transition_periods: np.ndarray
+    # periods added (long day) or removed (short day) by the transition
+    transition_shifts: np.ndarray
+
+    @classmethod
+    def from_index(cls, index):
+        return cls.from_date_range(
+            index[0], index[-1] + index.freq, index.tz, index.freq
+        )
+
+    @classmethod
+    def from_date_range(cls, start_date, end_date, timezone, frequency):
+        periods = pd.date_range(
+            start_date, end_date, freq=frequency, tz=timezone, closed="left"
+        )
+        period_nanos = periods.freq.nanos
+
+        # UTC offsets from the tz database, wall clock time = UTC + offset
+        offsets = (periods.tz_localize(None) - periods.tz_convert(None)).asi8
+        wall_nanos = periods.asi8 + offsets
+
+        day_starts = pd.date_range(
+            periods[0].normalize(), periods[-1].normalize(), freq="D"
+        )
+        day_boundaries = np.searchsorted(
+            periods.asi8, np.append(day_starts.asi8, periods.asi8[-1] + 1)
+        )
+        day_lengths = np.diff(day_boundaries)
+
+        is_transition = np.append(False, np.diff(offsets) != 0)
+        transition_idx = np.flatnonzero(is_transition)
+        offset_changes = offsets[transition_idx] - offsets[transition_idx - 1]
+        transition_shifts = -offset_changes // period_nanos
+
+        transition_days = np.searchsorted(day_boundaries, transition_idx, "right") - 1
+        wall_periods = (wall_nanos[transition_idx] % nanos_in_1_day) // period_nanos
+        # skipped periods start before the first period after the transition
+        transition_periods = wall_periods + np.minimum(transition_shifts, 0)
+
+        if len(np.unique(transition_days)) != len(transition_days):
+            raise ValueError(
+                f"Time zone {timezone} changes its UTC offset more than once a day. Exiting."
+            )
+
+        return cls(
+            day_starts=day_starts,
+            day_lengths=day_lengths,
+            transitions=periods[transition_idx],
+            transition_days=transition_days,
+            transition_periods=transition_periods,
+            transition_shifts=transition_shifts,
+        )
+
+    @property
+    def day_shifts(self):
+        day_shifts = np.zeros(len(self.day_starts), dtype=int)
+        day_shifts[self.transition_days] = self.transition_shifts
+        return day_shifts
+
+    @property
+    def is_short_day(self):
+        return self.day_shifts < 0
+
+    @property
+    def is_long_day(self):
+        return self.day_shifts > 0
+
+    def get_wall_periods(self, periods_in_1_day):
+        # wall clock period of the day of every period of the date range
+        regular_day = np.arange(periods_in_1_day)
+
+        segments = []
+        next_day = 0
+        for day, transition_period, shift in zip(
+            self.transition_days, self.transition_periods, self.transition_shifts
+        ):
+            segments.append(np.tile(regular_day, day - next_day))
+            if shift < 0:
+                skipped_periods = np.arange(
+                    transition_period, transition_period - shift
+                )
+                segments.append(np.delete(regular_day, skipped_periods))
+            else:
+                repeated_periods = np.arange(
+                    transition_period, transition_period + shift
+                )
+                segments.append(
+                    np.insert(regular_day, transition_period, repeated_periods)
+                )
+            next_day = day + 1
+        segments.append(np.tile(regular_day, len(self.day_starts) - next_day))
+
+        return np.concatenate(segments)
+
+    def get_repeated_periods(self):
+        # flat positions of the first and second occurrence of repeated periods
+        day_offsets = np.append(0, np.cumsum(self.day_lengths)[:-1])
+        is_long = self.transition_shifts > 0
+
+        first_starts = (
+            day_offsets[self.transition_days[is_long]]
+            + self.transition_periods[is_long]
+        )
+        shifts = self.transition_shifts[is_long]
+
+        return [
+            (
+                np.arange(start, start + shift),
+                np.arange(start + shift, start + 2 * shift),
+            )
+            for start, shift in zip(first_starts, shifts)
+        ]
+
+    def get_period_columns(self, periods_in_1_day):
+        # period of a regular day every period of the date range corresponds to,
+        # -1 for the first occurrence of repeated periods
+        columns = self.get_wall_periods(periods_in_1_day)
+        for first_occurrence, _ in self.get_repeated_periods():
+            columns[first_occurrence] = -1
+
+        return columns
+
+    def get_period_cells(self, periods_in_1_day):
+        # row and column of every period of the date range in a matrix of days,
+        # the second occurrence of repeated periods gets an extra row after its day
+        is_long_day = self.is_long_day.astype(int)
+        row_days = np.repeat(np.arange(len(self.day_starts)), 1 + is_long_day)
+        day_rows = np.cumsum(1 + is_long_day) - 1 - is_long_day
+
+        rows = np.repeat(day_rows, self.day_lengths)
+        for _, second_occurrence in self.get_repeated_periods():
+            rows[second_occurrence] += 1
+
+        return rows, self.get_wall_periods(periods_in_1_day), row_days
+
+    def period_mask(self, day_mask):
+        # expand a mask over days to a mask over the periods of the days
+        return np.repeat(day_mask, self.day_lengths)
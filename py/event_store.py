@@ -0,0 +1,164 @@
+import glob
+import os
+import numpy as np
+
+from .input_cache import (
+    file_signature,
+    merge_parts,
+    parse_csvs,
+    read_manifest,
+    write_manifest,
+)
+
+times_filename = "times.bin"
+values_filename = "values.bin"
+
+
+def ingest_device(sensor_source, args):
+    data_loading_args = args["data_loading"]
+    input_directory = data_loading_args["directory"]
+    store_directory = data_loading_args.get("event_store_directory")
+    if not store_directory:
+        raise AttributeError(
+            "Ingesting requires 'event_store_directory' in 'data_loading', the analysis reads the store from there. Exiting."
+        )
+
+    filenames = sorted(glob.glob(f"{input_directory}/{sensor_source}/*.csv"))
+    ingest_csvs(
+        filenames,
+        sensor_source,
+        data_loading_args["data_type"],
+        store_directory,
+        data_loading_args.get("reader_threads") or 4,
+    )
+
+
+def ingest_csvs(filenames, sensor_source, data_type, store_directory, reader_threads=4):
+    device_dir = f"{store_directory}/{sensor_source}"
+    if not os.path.isdir(device_dir):
+        os.makedirs(device_dir, exist_ok=True)
+
+    manifest = read_manifest(device_dir)
+    if manifest.get("data_type", data_type) != data_type:
+        raise ValueError(
+            f"Event store of {sensor_source} contains {manifest['data_type']} data, not {data_type}. Exiting."
+        )
+
+    ingested_files = manifest.get("files", {})
+    new_filenames = [
+        filename
+        for filename in filenames
+        if ingested_files.get(os.path.basename(filename)) != file_signature(filename)
+    ]
+    if len(new_filenames) == 0:
+        print(f"{sensor_source}: No new files to ingest")
+        return
+
+    times, values = merge_parts(parse_csvs(new_filenames, data_type, reader_threads))
+    append_events(device_dir, times, values)
+
+    for filename in new_filenames:
+        ingested_files[os.path.basename(filename)] = file_signature(filename)
+    write_manifest(device_dir, {"data_type": data_type, "files": ingested_files})
+
+    print(
+        f"{sensor_source}: Ingested {len(times)} rows from {len(new_filenames)} files"
+    )
+
+
+def append_events(device_dir, times, values):
+    stored_times, stored_values = open_store(device_dir)
+
+    if len(stored_times) != 0 and len(times) != 0:
+        is_after_store = times > stored_times[-1]
+        overlapping_times = times[~is_after_store]
+        positions = np.searchsorted(stored_times, overlapping_times)
+        positions = np.minimum(positions, len(stored_times) - 1)
+        is_stored = stored_times[positions] == overlapping_times
+
+        if not np.all(is_stored):
+            # backfill of older data, the store has to be rewritten to stay sorted
+            times, values = merge_parts(
+                [(stored_times, stored_values), (times, values)]
+            )
+            write_store(device_dir, times, values, mode="wb")
+            return
+
+        times = times[is_after_store]
+        if values is not None:
+            values = values[is_after_store]
+
+    cut_to_rows(device_dir, len(stored_times))
+    write_store(device_dir, times, values, mode="ab")
+
+
+def read_window(sensor_source, store_directory, start_ns, end_ns):
+    times, values = open_store(f"{store_directory}/{sensor_source}")
+
+    # only the pages of the requested window are read from disk
+    lo, hi = np.searchsorted(times, [start_ns, end_ns])
+    window_times = np.array(times[lo:hi])
+    window_values = None if values is None else np.array(values[lo:hi])
+
+    return window_times, window_values
+
+
+def open_store(device_dir):
+    times_path = f"{device_dir}/{times_filename}"
+    values_path = f"{device_dir}/{values_filename}"
+
+    if not os.path.isfile(times_path) or os.path.getsize(times_path) == 0:
+        return np.array([], dtype=np.int64), None
+
+    # an append interrupted between values.bin and times.bin leaves values
+    # without times at the end, only complete rows are used
+    times = open_array(times_path, np.int64)
+    values = None
+    if os.path.isfile(values_path):
+        values = open_array(values_path, np.float64)
+        if len(values) < len(times):
+            raise ValueError(
+                f"Event store {device_dir} has {len(times)} times but {len(values)} values. Exiting."
+            )
+        values = values[: len(times)]
+
+    return times, values
+
+
+def open_array(path, dtype):
+    rows = os.path.getsize(path) // np.dtype(dtype).itemsize
+    if rows == 0:
+        return np.array([], dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(rows,))
+
+
+def cut_to_rows(device_dir, rows):
+    # drops what an interrupted append wrote after the last complete row
+    for filename, dtype in [(times_filename, np.int64), (values_filename, np.float64)]:
+        path = f"{device_dir}/{filename}"
+        size = rows * np.dtype(dtype).itemsize
+        if os.path.isfile(path) and os.path.getsize(path) > size:
+            print(f"{device_dir}: Removing the incomplete rows of {filename}")
+            os.truncate(path, size)
+
+
+def write_store(device_dir, times, values, mode):
+    times_path = f"{device_dir}/{times_filename}"
+    values_path = f"{device_dir}/{values_filename}"
+
+    if mode == "wb":
+        # write next to the store and swap, so readers never see a partial file
+        write_array(f"{times_path}.tmp", times, mode)
+        if values is not None:
+            write_array(f"{values_path}.tmp", values, mode)
+            os.replace(f"{values_path}.tmp", values_path)
+        os.replace(f"{times_path}.tmp", times_path)
+    else:
+        if values is not None:
+            write_array(values_path, values, mode)
+        write_array(times_path, times, mode)
+
+
+def write_array(path, array, mode):
+    with open(path, mode) as file:
+        file.write(np.ascontiguousarray(array).tobytes())
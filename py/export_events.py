@@ -1,81 +1,64 @@
-import numpy as np
+from functools import partial
 
-from c8y_api import CumulocityRestApi
-from c8y_api.model import Measurement, Measurements
+from .measurement_payload import iter_measurement_collection
+from .upload_fingerprints import open_fingerprint_store
+from .upload_journal import open_upload_journal
+from .uploader import get_uploader, BatchSizer
 
 
 def export_results(sensor, ts_df, args):
     # data is standardized in cumulocity as UTC
     # revert index back to UTC
-    ts_df.index = ts_df.index.tz_convert("UTC")
+    ts_df = ts_df.tz_convert("UTC")
 
-    target_auth = args["target_auth"]
-    target_connection = CumulocityRestApi(
-        username=target_auth["username"],
-        password=target_auth["password"],
-        tenant_id=target_auth["tenant_id"],
-        base_url=target_auth["base_url"],
-    )
+    uploader = get_uploader(args)
 
-    target_sensor = sensor["target"]
-    # Multiple measurement
-    measurement_array = []
-    print(f'{sensor["name"]}: Preparing time series upload')
-    for index, row in ts_df.iterrows():
-        if args["upload_to_c8y"]["upload_anomaly_data"]:
-            c8y_Original = {
-                "Amount": {
-                    "unit": "n",
-                    "value": int(np.round(row["data"]))
-                    if not np.isnan(row["data"])
-                    else 0,
-                },
-                "Anomaly Label": {
-                    "unit": "n",
-                    "value": int(row["anomaly_label"])
-                    if not np.isnan(row["anomaly_label"])
-                    else 0,
-                },
-                "Anomaly Score": {
-                    "unit": "n",
-                    "value": float(row["anomaly_score"])
-                    if not np.isnan(row["anomaly_score"])
-                    else 0,
-                },
-                "Sensor error or no observations": {
-                    "unit": "n",
-                    "value": int(row["sensor_error"]),
-                },
-            }
+    fingerprints = open_fingerprint_store(sensor, args)
+    if fingerprints:
+        rows = len(ts_df)
+        ts_df = fingerprints.drop_unchanged(ts_df)
+        print(
+            f'{sensor["name"]}: Skipping {rows - len(ts_df)}/{rows} rows unchanged '
+            "since the last upload"
+        )
 
-            measurement_array.append(
-                Measurement(
-                    c8y=target_connection,
-                    type=args["upload_to_c8y"]["c8y_measurement_type"],
-                    source=target_sensor,
-                    time=index.isoformat(),
-                    c8y_Original=c8y_Original,
-                )
-            )
-        if args["upload_to_c8y"]["upload_imputation"]:
-            measurement_array.append(
-                Measurement(
-                    c8y=target_connection,
-                    type=args["upload_to_c8y"]["c8y_measurement_type"],
-                    source=target_sensor,
-                    time=index.isoformat(),
-                    c8y_Imputed={
-                        "Amount": {
-                            "unit": "n",
-                            "value": int(np.round(row["imputed_data"])),
-                        }
-                    },
-                    c8y_ImputedData={},
-                )
+    journal = open_upload_journal(sensor, args)
+    if journal:
+        rows = len(ts_df)
+        ts_df = journal.drop_uploaded(ts_df)
+        if len(ts_df) < rows:
+            print(
+                f'{sensor["name"]}: Resuming export, {rows - len(ts_df)}/{rows} rows '
+                "were uploaded already"
             )
 
-    print(f'{sensor["name"]}: Uploading time series')
-    # NB! Splat operator compulsory!
-    Measurements(c8y=target_connection).create(*measurement_array)
+    if len(ts_df) == 0:
+        print(f'{sensor["name"]}: Nothing to upload')
+        return
+
+    batch_sizer = BatchSizer.from_args(args)
 
-    print(f'{sensor["name"]}: Resources sent')
+    def build_body(split):
+        # the body is streamed, and built again if the upload is retried
+        return partial(iter_measurement_collection, sensor, split, args)
+
+    def on_uploaded(i, split):
+        if fingerprints:
+            fingerprints.record(split)
+        if journal:
+            journal.record(split)
+        print(f'{sensor["name"]}: Resources sent for batch {i+1} of {len(split)} rows')
+
+    print(
+        f'{sensor["name"]}: Uploading {len(ts_df)} rows, '
+        f"{uploader.max_in_flight} batches at a time"
+    )
+    try:
+        uploader.upload_batches(
+            batch_sizer.iter_batches(ts_df), build_body, on_uploaded, batch_sizer
+        )
+        print(f'{sensor["name"]}: Batch size settled at {batch_sizer.size} rows')
+    finally:
+        # keep the fingerprints of the accepted batches also when a batch failed
+        if fingerprints:
+            fingerprints.save()
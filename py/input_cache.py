@@ -0,0 +1,169 @@
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor
+
+manifest_filename = "manifest.json"
+series_filename = "series.npz"
+
+timestamp_format = "%Y-%m-%dT%H:%M:%S.%f%z"
+csv_dtypes = {"time": str, "value": np.float64}
+
+
+def read_device_series(filenames, data_type, reader_threads=4):
+    parts = parse_csvs(filenames, data_type, reader_threads)
+
+    return merge_parts(parts)
+
+
+def load_device_series(
+    filenames, sensor_source, data_type, cache_directory, reader_threads=4
+):
+    # parsed files are cached as epoch nanoseconds (UTC) next to a manifest
+    # of the file sizes and mtimes they were parsed from
+    device_dir = f"{cache_directory}/{sensor_source}"
+    files_dir = f"{device_dir}/files"
+    if not os.path.isdir(files_dir):
+        os.makedirs(files_dir, exist_ok=True)
+
+    manifest = read_manifest(device_dir)
+    signatures = {
+        os.path.basename(filename): file_signature(filename) for filename in filenames
+    }
+
+    is_same_data_type = manifest.get("data_type") == data_type
+    series_path = f"{device_dir}/{series_filename}"
+    if (
+        is_same_data_type
+        and manifest.get("files") == signatures
+        and os.path.isfile(series_path)
+    ):
+        print(f"Using cached series of {sensor_source}")
+        return load_arrays(series_path)
+
+    cached_files = manifest.get("files", {}) if is_same_data_type else {}
+
+    is_cached = [
+        cached_files.get(os.path.basename(filename))
+        == signatures[os.path.basename(filename)]
+        and os.path.isfile(f"{files_dir}/{os.path.basename(filename)}.npz")
+        for filename in filenames
+    ]
+    changed_filenames = [
+        filename for filename, cached in zip(filenames, is_cached) if not cached
+    ]
+    changed_parts = iter(parse_csvs(changed_filenames, data_type, reader_threads))
+
+    parts = []
+    for filename, cached in zip(filenames, is_cached):
+        part_path = f"{files_dir}/{os.path.basename(filename)}.npz"
+        if cached:
+            parts.append(load_arrays(part_path))
+        else:
+            times, values = next(changed_parts)
+            save_arrays(part_path, times, values)
+            parts.append((times, values))
+
+    # forget files that were removed from the input folder
+    for part_name in os.listdir(files_dir):
+        if part_name[: -len(".npz")] not in signatures:
+            os.remove(f"{files_dir}/{part_name}")
+
+    times, values = merge_parts(parts)
+    save_arrays(series_path, times, values)
+    write_manifest(device_dir, {"data_type": data_type, "files": signatures})
+
+    return times, values
+
+
+def parse_csvs(filenames, data_type, reader_threads=4):
+    def timed_parse_csv(filename):
+        begin = time.time()
+        parsed = parse_csv(filename, data_type)
+        return parsed, time.time() - begin
+
+    # pandas releases the GIL while tokenizing, so files are read in threads
+    parts = []
+    with ThreadPoolExecutor(max_workers=reader_threads) as executor:
+        for filename, (parsed, seconds) in zip(
+            filenames, executor.map(timed_parse_csv, filenames)
+        ):
+            megabytes = os.path.getsize(filename) / 1_000_000
+            print(
+                f"{filename}: {len(parsed[0])} rows, {megabytes:.1f} MB in {seconds:.2f}s "
+                f"({megabytes / max(seconds, 1e-9):.1f} MB/s)"
+            )
+            parts.append(parsed)
+
+    return parts
+
+
+def parse_csv(filename, data_type):
+    columns = ["time", "value"] if data_type == "MEASUREMENT" else ["time"]
+    df = pd.read_csv(
+        filename,
+        usecols=columns,
+        dtype={column: csv_dtypes[column] for column in columns},
+    )
+
+    try:
+        dti = pd.to_datetime(df["time"].values, utc=True, format=timestamp_format)
+    except ValueError:
+        # fall back to format inference for non ISO-8601 exports
+        dti = pd.to_datetime(df["time"].values, utc=True)
+
+    times = dti.asi8
+    values = None
+    if data_type == "MEASUREMENT":
+        values = df["value"].values
+
+    return times, values
+
+
+def merge_parts(parts):
+    if len(parts) == 0:
+        return np.array([], dtype=np.int64), None
+
+    times = np.concatenate([part_times for part_times, _ in parts])
+    # np.unique returns the first occurrence of every timestamp in sorted order
+    times, first_idx = np.unique(times, return_index=True)
+
+    values = None
+    if parts[0][1] is not None:
+        values = np.concatenate([part_values for _, part_values in parts])[first_idx]
+
+    return times, values
+
+
+def file_signature(filename):
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_arrays(path):
+    with np.load(path) as arrays:
+        values = arrays["values"] if "values" in arrays.files else None
+        return arrays["times"], values
+
+
+def save_arrays(path, times, values):
+    if values is None:
+        np.savez(path, times=times)
+    else:
+        np.savez(path, times=times, values=values)
+
+
+def read_manifest(device_dir):
+    path = f"{device_dir}/{manifest_filename}"
+    if not os.path.isfile(path):
+        return {}
+    with open(path) as file:
+        return json.load(file)
+
+
+def write_manifest(device_dir, manifest):
+    with open(f"{device_dir}/{manifest_filename}", "w") as file:
+        json.dump(manifest, file)
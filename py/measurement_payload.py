@@ -0,0 +1,127 @@
+import json
+import numpy as np
+
+# rows formatted and joined to a string at a time while streaming the body
+rows_in_1_chunk = 1000
+
+measurement_head = '{"type": %(type)s, "time": "%(time)s", '
+measurement_tail = ', "source": {"id": %(source)s}}'
+
+original_fragment = (
+    '"c8y_Original": {'
+    '"Amount": {"unit": "n", "value": %(amount)s}, '
+    '"Anomaly Label": {"unit": "n", "value": %(label)s}, '
+    '"Anomaly Score": {"unit": "n", "value": %(score)s}, '
+    '"Sensor error or no observations": {"unit": "n", "value": %(sensor_error)s}'
+    "}"
+)
+
+imputed_fragments = (
+    '"c8y_Imputed": {'
+    '"Amount": {"unit": "n", "value": %(imputed_amount)s}'
+    '}, "c8y_ImputedData": {}'
+)
+
+
+uploaded_columns = {
+    "upload_anomaly_data": ["data", "anomaly_label", "anomaly_score", "sensor_error"],
+    "upload_imputation": ["imputed_data"],
+}
+
+
+def get_uploaded_columns(upload_args):
+    return [
+        column
+        for setting, setting_columns in uploaded_columns.items()
+        if upload_args[setting]
+        for column in setting_columns
+    ]
+
+
+def get_payload_settings(sensor, upload_args):
+    # settings besides the uploaded columns that change the payload of a row
+    return [
+        sensor["target"],
+        upload_args["c8y_measurement_type"],
+        bool(upload_args.get("combine_measurements")),
+    ]
+
+
+def iter_measurement_collection(sensor, ts_df, args):
+    # the same JSON, byte for byte, as serializing c8y_api Measurement objects
+    # of every row, built from whole columns and yielded in chunks of rows
+    upload_args = args["upload_to_c8y"]
+
+    fragments = []
+    columns = {
+        "time": get_iso_times(ts_df.index),
+        "type": [json.dumps(upload_args["c8y_measurement_type"])] * len(ts_df),
+        "source": [json.dumps(sensor["target"])] * len(ts_df),
+    }
+    if upload_args["upload_anomaly_data"]:
+        fragments.append(original_fragment)
+        columns["amount"] = to_json_ints(np.round(ts_df["data"].to_numpy()), 0)
+        columns["label"] = to_json_ints(np.trunc(ts_df["anomaly_label"].to_numpy()), 0)
+        columns["score"] = to_json_floats(ts_df["anomaly_score"].to_numpy(), 0)
+        columns["sensor_error"] = to_json_ints(ts_df["sensor_error"].to_numpy())
+    if upload_args["upload_imputation"]:
+        fragments.append(imputed_fragments)
+        columns["imputed_amount"] = to_json_ints(
+            np.round(ts_df["imputed_data"].to_numpy())
+        )
+
+    if upload_args.get("combine_measurements"):
+        # one measurement per period carrying all fragments
+        row_template = measurement_head + ", ".join(fragments) + measurement_tail
+    else:
+        row_template = ", ".join(
+            measurement_head + fragment + measurement_tail for fragment in fragments
+        )
+    names = list(columns)
+
+    yield b'{"measurements": ['
+    for start in range(0, len(ts_df), rows_in_1_chunk):
+        chunk = zip(*(columns[name][start : start + rows_in_1_chunk] for name in names))
+        rows = ", ".join(row_template % dict(zip(names, row)) for row in chunk)
+        yield (", " if start > 0 else "").encode() + rows.encode()
+    yield b"]}"
+
+
+def get_iso_times(index):
+    # Timestamp.isoformat() of every period, e.g. 2021-03-28T01:00:00+00:00
+    if index.tz is None or str(index.tz) != "UTC":
+        raise ValueError("Measurement times must be in UTC. Exiting.")
+
+    nanos = index.asi8
+    if np.any(nanos % 1_000_000_000 != 0):
+        # fractional seconds are rare, isoformat decides on their precision
+        return [timestamp.isoformat() for timestamp in index]
+
+    seconds = np.datetime_as_string(nanos.astype("datetime64[ns]"), unit="s")
+    return np.char.add(seconds, "+00:00").tolist()
+
+
+def to_json_ints(values, nan_value=None):
+    # NaN is written as nan_value or rejected like int(nan) would be
+    values = np.asarray(values, dtype=float)
+    is_nan = np.isnan(values)
+    if nan_value is None and np.any(is_nan):
+        raise ValueError("cannot convert float NaN to integer")
+    if np.any(np.isinf(values)):
+        raise OverflowError("cannot convert float infinity to integer")
+
+    strings = np.where(is_nan, 0, values).astype(np.int64).astype(str).astype(object)
+    strings[is_nan] = str(nan_value)
+    return strings.tolist()
+
+
+def to_json_floats(values, nan_value):
+    values = np.asarray(values, dtype=float)
+    is_nan = np.isnan(values)
+    if np.any(np.isinf(values)):
+        raise ValueError("Out of range float values are not JSON compliant")
+
+    # repr is the shortest string that reads back to the same float, as in json
+    strings = np.array(list(map(repr, values.tolist())), dtype=object)
+    strings[is_nan] = str(nan_value)
+    return strings.tolist()
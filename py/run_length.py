@@ -0,0 +1,37 @@
+import numpy as np
+
+
+def run_length_encode(values):
+    values = np.asarray(values)
+    if len(values) == 0:
+        empty = np.array([], dtype=int)
+        return empty, empty, values
+
+    is_run_start = np.append(True, values[1:] != values[:-1])
+    starts = np.flatnonzero(is_run_start)
+    lengths = np.diff(np.append(starts, len(values)))
+
+    return starts, lengths, values[starts]
+
+
+def get_gap_lengths(values):
+    _, lengths, is_nan = run_length_encode(np.isnan(values))
+    return lengths[is_nan]
+
+
+def get_gap_length_histogram(gap_lengths):
+    # bins of 1, 2-3, 4-7, 8-15, ... periods
+    if len(gap_lengths) == 0:
+        return {}
+
+    bins = np.floor(np.log2(gap_lengths)).astype(int)
+    counts = np.bincount(bins)
+
+    histogram = {}
+    for power, count in enumerate(counts):
+        if count == 0:
+            continue
+        low, high = 2**power, 2 ** (power + 1) - 1
+        histogram[f"{low}" if low == high else f"{low}-{high}"] = int(count)
+
+    return histogram
@@ -0,0 +1,31 @@
+import numpy as np
+
+
+def get_daily_profile(days, method="mean"):
+    # additive daily seasonality of gapless days (days x periods_in_1_day)
+    # "mean" is equivalent to the seasonal component of statsmodels seasonal_decompose
+    periods_in_1_day = days.shape[1]
+    flat_values = days.ravel()
+
+    # centered moving average of 1 day as trend
+    if periods_in_1_day % 2 == 0:  # split weights at ends
+        trend_filter = np.array([0.5] + [1] * (periods_in_1_day - 1) + [0.5])
+    else:
+        trend_filter = np.ones(periods_in_1_day)
+    trend_filter = trend_filter / periods_in_1_day
+
+    trend = np.full(len(flat_values), np.nan)
+    valid_trend = np.convolve(flat_values, trend_filter, mode="valid")
+    trend_start = periods_in_1_day // 2
+    trend[trend_start : trend_start + len(valid_trend)] = valid_trend
+
+    detrended = (flat_values - trend).reshape(days.shape)
+
+    if method == "mean":
+        profile = np.nanmean(detrended, axis=0)
+        return profile - np.mean(profile)
+    elif method == "median":
+        profile = np.nanmedian(detrended, axis=0)
+        return profile - np.median(profile)
+
+    raise ValueError(f"Unknown seasonality method {method}. Exiting.")
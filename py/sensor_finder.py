@@ -1,51 +1,77 @@
-from c8y_api import CumulocityRestApi
+import json
+import os
+import time
+
 from c8y_api.model import Inventory
 from c8y_api.model.managedobjects import DeviceGroup
+from requests.exceptions import RequestException
+
+from .c8y_connection import get_connection
+
+# ids per inventory query, keeps the query url short
+ids_in_1_query = 200
+# largest page size Cumulocity returns
+page_size = 2000
 
 
 def get_sensor_list(args):
     devices = args["data_loading"]["devices"]
 
-    source_auth = args["source_auth"]
-    source_connection = CumulocityRestApi(
-        username=source_auth["username"],
-        password=source_auth["password"],
-        tenant_id=source_auth["tenant_id"],
-        base_url=source_auth["base_url"],
-    )
-    target_auth = args["target_auth"]
-    target_connection = CumulocityRestApi(
-        username=target_auth["username"],
-        password=target_auth["password"],
-        tenant_id=target_auth["tenant_id"],
-        base_url=target_auth["base_url"],
-    )
+    cache_file = args["data_loading"].get("sensor_cache_file")
+    ttl_hours = args["data_loading"].get("sensor_cache_ttl_hours") or 24
 
-    source_inventory = Inventory(c8y=source_connection)
+    cache = read_sensor_cache(cache_file, devices)
+    if cache and time.time() - cache["created"] < ttl_hours * 3600:
+        sensorList = cache["sensors"]
+    else:
+        try:
+            sensorList = resolve_sensors(devices, args)
+        except RequestException as exception:
+            if not cache:
+                raise
+            # work offline from an expired cache
+            print(
+                f"Failed to resolve devices with {type(exception).__name__}, "
+                "using cached devices"
+            )
+            sensorList = cache["sensors"]
+        else:
+            write_sensor_cache(cache_file, devices, sensorList)
 
-    source_devices_ids = ",".join([str(device["source"]) for device in devices])
-    base_query = source_inventory._build_base_query(ids=source_devices_ids)
+    for sensor in sensorList:
+        print(sensor)
 
-    source_sensors = list(
-        source_inventory._iterate(
-            base_query=base_query, limit=9999, parse_func=DeviceGroup.from_json
-        )
+    return sensorList
+
+
+def resolve_sensors(devices, args):
+    source_connection = get_connection(args["source_auth"])
+    target_connection = get_connection(args["target_auth"])
+
+    source_sensors = get_managed_objects(
+        Inventory(c8y=source_connection), [device["source"] for device in devices]
+    )
+    target_sensors = get_managed_objects(
+        Inventory(c8y=target_connection), [device["target"] for device in devices]
     )
 
     assert len(source_sensors) == len(
         devices
     ), "Failed to find a device for each source device id"
 
-    target_inventory = Inventory(c8y=target_connection)
+    missing_targets = [
+        device["target"]
+        for device in devices
+        if str(device["target"]) not in target_sensors
+    ]
+    if len(missing_targets) != 0:
+        raise KeyError(f"Failed to find target devices {missing_targets}")
+
+    targets = {str(device["source"]): str(device["target"]) for device in devices}
+
     sensorList = []
-    for source_sensor in source_sensors:
-        device = list(
-            filter(
-                lambda device: str(device["source"]) == source_sensor.id,
-                devices,
-            )
-        )[0]
-        target_sensor = target_inventory.get(device["target"])
+    for source_sensor in source_sensors.values():
+        target_sensor = target_sensors[targets[source_sensor.id]]
         sensorList.append(
             {
                 "name": source_sensor.name,
@@ -53,7 +79,58 @@ def get_sensor_list(args):
                 "target": target_sensor.id,
             }
         )
-    for sensor in sensorList:
-        print(sensor)
 
     return sensorList
+
+
+def get_managed_objects(inventory, ids):
+    # managed objects by id, queried by lists of ids
+    ids = list(dict.fromkeys(str(id) for id in ids))
+
+    managed_objects = {}
+    for start in range(0, len(ids), ids_in_1_query):
+        base_query = inventory._build_base_query(
+            ids=",".join(ids[start : start + ids_in_1_query]), page_size=page_size
+        )
+        for managed_object in inventory._iterate(
+            base_query=base_query, limit=9999, parse_func=DeviceGroup.from_json
+        ):
+            managed_objects[managed_object.id] = managed_object
+
+    return managed_objects
+
+
+def read_sensor_cache(cache_file, devices):
+    # cached sensors, if they were resolved for the same devices
+    if not cache_file or not os.path.isfile(cache_file):
+        return None
+
+    with open(cache_file) as f:
+        cache = json.load(f)
+
+    if cache["devices"] != get_device_keys(devices):
+        return None
+
+    return cache
+
+
+def write_sensor_cache(cache_file, devices, sensorList):
+    if not cache_file:
+        return
+
+    cache_dir = os.path.dirname(cache_file)
+    if cache_dir and not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+
+    cache = {
+        "created": time.time(),
+        "devices": get_device_keys(devices),
+        "sensors": sensorList,
+    }
+    with open(cache_file + ".tmp", "w") as f:
+        json.dump(cache, f, indent=2)
+    os.replace(cache_file + ".tmp", cache_file)
+
+
+def get_device_keys(devices):
+    return [[str(device["source"]), str(device["target"])] for device in devices]
@@ -0,0 +1,155 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+
+from concurrent.futures import ThreadPoolExecutor
+
+from .c8y_connection import get_connection, send_with_retries
+from .event_store import append_events, open_store
+from .input_cache import merge_parts, read_manifest, write_manifest, timestamp_format
+
+resources = {
+    "EVENT": ("/event/events", "events"),
+    "MEASUREMENT": ("/measurement/measurements", "measurements"),
+}
+
+
+def fetch_device(sensor_source, args):
+    # pull the device's events or measurements of the date range from the
+    # source tenant into the event store, continuing after the last stored one
+    data_loading_args = args["data_loading"]
+    fetch_args = args.get("fetch_from_c8y") or {}
+    data_type = data_loading_args["data_type"]
+    store_directory = data_loading_args.get("event_store_directory")
+    if not store_directory:
+        raise AttributeError(
+            "Fetching requires 'event_store_directory' in 'data_loading', the analysis reads the store from there. Exiting."
+        )
+    timezone = data_loading_args.get("timezone") or "Europe/Helsinki"
+
+    device_dir = f"{store_directory}/{sensor_source}"
+    if not os.path.isdir(device_dir):
+        os.makedirs(device_dir, exist_ok=True)
+
+    manifest = read_manifest(device_dir)
+    if manifest.get("data_type", data_type) != data_type:
+        raise ValueError(
+            f"Event store of {sensor_source} contains {manifest['data_type']} data, not {data_type}. Exiting."
+        )
+
+    start_date = pd.to_datetime(data_loading_args["start_date"]).tz_localize(timezone)
+    end_date = pd.to_datetime(data_loading_args["end_date"]).tz_localize(timezone)
+
+    stored_times, _ = open_store(device_dir)
+    if len(stored_times) != 0 and stored_times[-1] >= start_date.value:
+        # the last stored timestamp is fetched again, the store drops it
+        start_date = pd.Timestamp(stored_times[-1], tz="UTC").tz_convert(timezone)
+    if start_date >= end_date:
+        print(f"{sensor_source}: Nothing to fetch")
+        return
+
+    fetcher = SourceFetcher(args)
+    slices = get_time_slices(start_date, end_date, fetch_args.get("slice_days") or 30)
+
+    begin = time.time()
+    with ThreadPoolExecutor(max_workers=fetcher.max_in_flight) as executor:
+        parts = list(
+            executor.map(
+                lambda time_slice: fetcher.fetch_slice(
+                    sensor_source, data_type, *time_slice
+                ),
+                slices,
+            )
+        )
+    times, values = merge_parts(parts)
+    end = time.time()
+
+    append_events(device_dir, times, values)
+    write_manifest(device_dir, {**manifest, "data_type": data_type})
+
+    print(
+        f"{sensor_source}: Fetched {len(times)} rows from {start_date.isoformat()} "
+        f"in {len(slices)} slices in {end - begin:.1f}s"
+    )
+
+
+def get_time_slices(start_date, end_date, slice_days):
+    boundaries = pd.date_range(start_date, end_date, freq=f"{slice_days}D")
+    boundaries = boundaries.append(pd.DatetimeIndex([end_date])).unique()
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+class SourceFetcher:
+    def __init__(self, args):
+        fetch_args = args.get("fetch_from_c8y") or {}
+        self.max_in_flight = fetch_args.get("fetch_threads") or 4
+        self.page_size = fetch_args.get("page_size") or 2000
+        self.event_type = fetch_args.get("event_type")
+        self.fragment = fetch_args.get("measurement_fragment")
+        self.series = fetch_args.get("measurement_series")
+        if args["data_loading"]["data_type"] == "MEASUREMENT" and not (
+            self.fragment and self.series
+        ):
+            raise AttributeError(
+                "Fetching measurements requires 'measurement_fragment' and 'measurement_series'. Exiting."
+            )
+        self.max_retries = fetch_args.get("max_retries") or 5
+        self.backoff_seconds = fetch_args.get("retry_backoff_seconds") or 1.0
+        # a stalled connection becomes a Timeout that is retried
+        self.timeout_seconds = fetch_args.get("fetch_timeout_seconds", 60.0)
+
+        self.c8y = get_connection(args["source_auth"], self.max_in_flight)
+
+    def fetch_slice(self, sensor_source, data_type, date_from, date_to):
+        resource, object_name = resources[data_type]
+        params = {
+            "source": sensor_source,
+            "dateFrom": date_from.tz_convert("UTC").isoformat(timespec="milliseconds"),
+            "dateTo": date_to.tz_convert("UTC").isoformat(timespec="milliseconds"),
+            "pageSize": self.page_size,
+        }
+        if data_type == "EVENT" and self.event_type:
+            params["type"] = self.event_type
+        if data_type == "MEASUREMENT":
+            params["valueFragmentType"] = self.fragment
+            params["valueFragmentSeries"] = self.series
+
+        time_pages = []
+        value_pages = []
+        page_number = 1
+        while True:
+            page = self.get_page(resource, {**params, "currentPage": page_number})
+            objects = page[object_name]
+            time_pages.append([obj["time"] for obj in objects])
+            if data_type == "MEASUREMENT":
+                value_pages.append(
+                    [obj[self.fragment][self.series]["value"] for obj in objects]
+                )
+            if len(objects) < self.page_size:
+                break
+            page_number += 1
+
+        times = np.concatenate([np.array(page, dtype=object) for page in time_pages])
+        times = pd.to_datetime(times, utc=True, format=timestamp_format).asi8
+        values = None
+        if data_type == "MEASUREMENT":
+            values = np.concatenate(
+                [np.array(page, dtype=float) for page in value_pages]
+            )
+
+        return times, values
+
+    def get_page(self, resource, params):
+        response = send_with_retries(
+            lambda: self.c8y.session.get(
+                self.c8y.base_url + resource,
+                params=params,
+                headers={"Accept": "application/json"},
+                timeout=self.timeout_seconds,
+            ),
+            f"fetch {resource}",
+            self.max_retries,
+            self.backoff_seconds,
+        )
+        return response.json()
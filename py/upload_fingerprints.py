@@ -0,0 +1,86 @@
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+import pandas as pd
+
+from .measurement_payload import get_uploaded_columns, get_payload_settings
+
+
+def open_fingerprint_store(sensor, args):
+    fingerprint_dir = args["upload_to_c8y"].get("fingerprint_directory")
+    if not fingerprint_dir:
+        return None
+
+    if not os.path.isdir(fingerprint_dir):
+        os.makedirs(fingerprint_dir, exist_ok=True)
+
+    return FingerprintStore(f'{fingerprint_dir}/{sensor["source"]}.npz', sensor, args)
+
+
+class FingerprintStore:
+    # hash of the uploaded values of every timestamp sent to Cumulocity,
+    # sorted by UTC time, reset when the payload settings change
+    def __init__(self, filename, sensor, args):
+        self.filename = filename
+        self.columns = get_uploaded_columns(args["upload_to_c8y"])
+        self.settings_hash = hashlib.sha1(
+            json.dumps(get_payload_settings(sensor, args["upload_to_c8y"])).encode()
+        ).hexdigest()
+        self.lock = threading.Lock()
+        self.uploaded = []
+
+        self.times = np.array([], dtype=np.int64)
+        self.fingerprints = np.array([], dtype=np.uint64)
+        if os.path.isfile(filename):
+            with np.load(filename) as stored:
+                if stored["settings_hash"] == self.settings_hash:
+                    self.times = stored["times"]
+                    self.fingerprints = stored["fingerprints"]
+
+    def drop_unchanged(self, ts_df):
+        # rows whose values were uploaded already
+        times = ts_df.index.asi8
+        fingerprints = self.get_fingerprints(ts_df)
+
+        positions = np.searchsorted(self.times, times)
+        positions = np.minimum(positions, max(len(self.times) - 1, 0))
+        is_unchanged = np.zeros(len(ts_df), dtype=bool)
+        if len(self.times) > 0:
+            is_unchanged = (self.times[positions] == times) & (
+                self.fingerprints[positions] == fingerprints
+            )
+
+        return ts_df[~is_unchanged]
+
+    def record(self, batch):
+        with self.lock:
+            self.uploaded.append((batch.index.asi8, self.get_fingerprints(batch)))
+
+    def save(self):
+        # the recorded fingerprints replace the stored ones of the same time
+        with self.lock:
+            if len(self.uploaded) == 0:
+                return
+            times = np.concatenate([times for times, _ in self.uploaded] + [self.times])
+            fingerprints = np.concatenate(
+                [fingerprints for _, fingerprints in self.uploaded]
+                + [self.fingerprints]
+            )
+            self.uploaded = []
+
+        self.times, first = np.unique(times, return_index=True)
+        self.fingerprints = fingerprints[first]
+
+        with open(self.filename + ".tmp", "wb") as f:
+            np.savez(
+                f,
+                times=self.times,
+                fingerprints=self.fingerprints,
+                settings_hash=self.settings_hash,
+            )
+        os.replace(self.filename + ".tmp", self.filename)
+
+    def get_fingerprints(self, ts_df):
+        return pd.util.hash_pandas_object(ts_df[self.columns], index=False).to_numpy()
@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import pickle
+import threading
+import numpy as np
+import pandas as pd
+
+from .measurement_payload import get_uploaded_columns, get_payload_settings
+from .preparer import get_input_signature
+
+# settings that change the analysed ts_df of a sensor
+analysis_args = ["data_loading", "detect_anomalies", "impute_data_gaps", "seasonality"]
+
+
+def get_journal_directory(args):
+    return args["upload_to_c8y"].get("journal_directory")
+
+
+def save_checkpoint(sensor, ts_df, args):
+    journal_dir = get_journal_directory(args)
+    if not journal_dir:
+        return
+
+    if not os.path.isdir(journal_dir):
+        os.makedirs(journal_dir, exist_ok=True)
+
+    filename = f'{journal_dir}/{sensor["source"]}.checkpoint.pickle'
+    with open(filename + ".tmp", "wb") as f:
+        pickle.dump(
+            {
+                "args_hash": get_args_hash(args),
+                "input_signature": get_input_signature(sensor["source"], args),
+                "ts_df": ts_df,
+            },
+            f,
+        )
+    os.replace(filename + ".tmp", filename)
+
+
+def load_checkpoint(sensor, args):
+    # analysed ts_df of a sensor whose export did not finish, None otherwise
+    journal_dir = get_journal_directory(args)
+    if not journal_dir:
+        return None
+
+    filename = f'{journal_dir}/{sensor["source"]}.checkpoint.pickle'
+    if not os.path.isfile(filename):
+        return None
+
+    with open(filename, "rb") as f:
+        checkpoint = pickle.load(f)
+    if checkpoint["args_hash"] != get_args_hash(args):
+        print(f'{sensor["name"]}: Settings changed, ignoring export checkpoint')
+        return None
+    if checkpoint.get("input_signature") != get_input_signature(sensor["source"], args):
+        print(f'{sensor["name"]}: Input data changed, ignoring export checkpoint')
+        return None
+
+    return checkpoint["ts_df"]
+
+
+def remove_checkpoint(sensor, args):
+    journal_dir = get_journal_directory(args)
+    if not journal_dir:
+        return
+
+    for filename in [
+        f'{journal_dir}/{sensor["source"]}.checkpoint.pickle',
+        f'{journal_dir}/{sensor["source"]}.journal',
+    ]:
+        if os.path.isfile(filename):
+            os.remove(filename)
+
+
+def get_args_hash(args):
+    settings = {name: args.get(name) for name in analysis_args}
+    settings["data_loading"] = {
+        key: value
+        for key, value in (settings["data_loading"] or {}).items()
+        if key != "devices"
+    }
+    return hashlib.sha1(
+        json.dumps(settings, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def open_upload_journal(sensor, args):
+    journal_dir = get_journal_directory(args)
+    if not journal_dir:
+        return None
+
+    if not os.path.isdir(journal_dir):
+        os.makedirs(journal_dir, exist_ok=True)
+
+    return UploadJournal(f'{journal_dir}/{sensor["source"]}.journal', sensor, args)
+
+
+class UploadJournal:
+    # append-only file of the batches acknowledged by Cumulocity, one JSON line
+    # with the UTC time range and content hash of the rows of a batch each
+    def __init__(self, filename, sensor, args):
+        self.filename = filename
+        self.columns = get_uploaded_columns(args["upload_to_c8y"])
+        self.settings = get_payload_settings(sensor, args["upload_to_c8y"])
+        self.lock = threading.Lock()
+
+    def drop_uploaded(self, ts_df):
+        # rows of journaled batches whose content is still the same, a batch of
+        # a resumed run covers the rows that were left after the earlier runs
+        if not os.path.isfile(self.filename):
+            return ts_df
+
+        times = ts_df.index.asi8
+        is_uploaded = np.zeros(len(ts_df), dtype=bool)
+        with open(self.filename) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line of a crashed run may be cut off
+                    continue
+                remaining = np.flatnonzero(~is_uploaded)
+                start = np.searchsorted(times[remaining], entry["start"], "left")
+                end = np.searchsorted(times[remaining], entry["end"], "right")
+                rows = remaining[start:end]
+                if self.get_hash(ts_df.iloc[rows]) == entry["hash"]:
+                    is_uploaded[rows] = True
+
+        return ts_df[~is_uploaded]
+
+    def record(self, batch):
+        entry = {
+            "start": int(batch.index.asi8[0]),
+            "end": int(batch.index.asi8[-1]),
+            "rows": len(batch),
+            "hash": self.get_hash(batch),
+        }
+        with self.lock, open(self.filename, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def get_hash(self, batch):
+        # the uploaded columns and the settings forming the payload
+        settings = self.settings + [len(batch)]
+        row_hashes = pd.util.hash_pandas_object(batch[self.columns], index=True)
+        return hashlib.sha1(
+            json.dumps(settings).encode() + row_hashes.to_numpy().tobytes()
+        ).hexdigest()
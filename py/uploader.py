@@ -0,0 +1,163 @@
+import json
+import threading
+import zlib
+
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from .c8y_connection import get_connection, send_with_retries
+
+measurements_resource = "/measurement/measurements"
+
+uploaders = threading.local()
+
+
+def get_uploader(args):
+    # one uploader (and HTTP session) per worker thread, reused across sensors
+    if not hasattr(uploaders, "uploader"):
+        uploaders.uploader = MeasurementUploader(args)
+    return uploaders.uploader
+
+
+class MeasurementUploader:
+    def __init__(self, args):
+        upload_args = args["upload_to_c8y"]
+        self.max_in_flight = upload_args.get("max_concurrent_uploads") or 4
+        self.max_retries = upload_args.get("max_retries") or 5
+        self.backoff_seconds = upload_args.get("retry_backoff_seconds") or 1.0
+        self.gzip_payloads = upload_args.get("gzip_payloads") or False
+        self.timeout_seconds = upload_args.get("upload_timeout_seconds")
+
+        self.c8y = get_connection(args["target_auth"], self.max_in_flight)
+
+        self.executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+
+    def upload_batches(self, batches, build_body, on_uploaded=None, batch_sizer=None):
+        # batches are taken from the iterable only when an upload slot is free,
+        # build_body turns a batch into the request body in the upload thread,
+        # on_uploaded runs in the upload thread as soon as a batch is accepted
+        def upload_batch(i, batch):
+            body = build_body(batch)
+            on_retry = (
+                partial(batch_sizer.on_retry, len(batch)) if batch_sizer else None
+            )
+            response = self.post_measurements(body, on_retry=on_retry)
+            if batch_sizer:
+                batch_sizer.on_uploaded(len(batch), response.elapsed.total_seconds())
+            if on_uploaded:
+                on_uploaded(i, batch)
+
+        futures = set()
+        try:
+            for i, batch in enumerate(batches):
+                if len(futures) >= self.max_in_flight:
+                    done, futures = wait(futures, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                futures.add(self.executor.submit(upload_batch, i, batch))
+            for future in futures:
+                future.result()
+        except Exception:
+            # uploads that already started are finished, so every accepted
+            # batch is recorded before the caller saves or resumes
+            for future in futures:
+                future.cancel()
+            wait(futures)
+            raise
+
+    def post_measurements(self, body, headers=None, on_retry=None):
+        # body is a dict, bytes, or a function returning an iterable of bytes
+        # that is sent with chunked transfer encoding
+        if isinstance(body, dict):
+            body = json.dumps(body, allow_nan=False).encode("utf-8")
+
+        request_headers = {
+            "Content-Type": self.c8y.CONTENT_MEASUREMENT_COLLECTION,
+            **(headers or {}),
+        }
+        if self.gzip_payloads:
+            request_headers["Content-Encoding"] = "gzip"
+
+        return send_with_retries(
+            lambda: self.c8y.session.post(
+                self.c8y.base_url + measurements_resource,
+                data=self.get_request_data(body),
+                headers=request_headers,
+                timeout=self.timeout_seconds,
+            ),
+            "upload measurements",
+            self.max_retries,
+            self.backoff_seconds,
+            on_retry,
+        )
+
+    def get_request_data(self, body):
+        data = body() if callable(body) else body
+        if not self.gzip_payloads:
+            return data
+        if isinstance(data, bytes):
+            return gzip_chunks([data])
+        return gzip_chunks(data)
+
+
+class BatchSizer:
+    # additive increase, multiplicative decrease of the rows per upload request:
+    # grows while requests answer within target_seconds, halves on slow answers,
+    # 429, 5xx and connection errors
+    def __init__(self, size, min_size, max_size, target_seconds):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+        self.size = min(max(size, min_size), max_size)
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_args(cls, args):
+        upload_args = args["upload_to_c8y"]
+        size = upload_args["batch_upload_size"] or 10000
+        if not upload_args.get("target_upload_seconds"):
+            return cls(size, size, size, None)
+
+        min_size = upload_args.get("min_batch_upload_size") or 100
+        return cls(
+            size,
+            min_size,
+            upload_args.get("max_batch_upload_size") or 10 * size,
+            upload_args["target_upload_seconds"],
+        )
+
+    def on_uploaded(self, rows, seconds):
+        if self.target_seconds is None:
+            return
+        if seconds > self.target_seconds:
+            self.decrease(rows)
+            return
+        with self.lock:
+            self.size = min(self.size + self.min_size, self.max_size)
+
+    def on_retry(self, rows):
+        if self.target_seconds is not None:
+            self.decrease(rows)
+
+    def decrease(self, rows):
+        # requests sent before the last decrease do not decrease again
+        with self.lock:
+            if rows >= self.size:
+                self.size = max(self.size // 2, self.min_size)
+
+    def iter_batches(self, ts_df):
+        start = 0
+        while start < len(ts_df):
+            end = start + self.size
+            yield ts_df.iloc[start:end]
+            start = end
+
+
+def gzip_chunks(chunks):
+    # compress a stream of bytes into a stream of gzip bytes
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -1,79 +1,68 @@
-from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import multiprocessing
+import queue
+import threading
 import time
-import numpy as np
 
 from py.anomaly_detection.anomaly_detector import detect_anomalies, mark_missing_data
 from py.plot import plot_result
 from py.sensor_finder import get_sensor_list
 from py.export_events import export_results
+from py.upload_journal import save_checkpoint, load_checkpoint, remove_checkpoint
 from py.imputer import (
     impute_small_gaps,
     impute_big_gaps,
 )
+from py.day_grid import DayGrid
+from py.dst_calendar import DstCalendar
+from py.run_length import get_gap_lengths, get_gap_length_histogram
 from py.preparer import (
     get_period_data,
     to_period_df,
     define_nights,
-    separate_workdays_and_weekends,
+    get_input_size,
 )
 
 
-def process(sensor, args):
-    begin = time.time()
-
+def load(sensor, args):
     print(f'{sensor["name"]}: Loading data')
-    ts_df = to_period_df(sensor["source"], args)
+    return to_period_df(sensor["source"], args)
 
+
+def analyse(sensor, ts_df, args):
     period_data = get_period_data(ts_df)
+    dst_calendar = DstCalendar.from_index(ts_df.index)
 
     print(f'{sensor["name"]}: Defining nights')
     ts_df = define_nights(ts_df)
 
-    print(f'{sensor["name"]}: Separating data to workdays and weekends')
-    (
-        workdays_df,
-        tumbled_workdays_df,
-        weekends_df,
-        tumbled_weekends_df,
-    ) = separate_workdays_and_weekends(ts_df[["data"]], period_data)
-    tumbled_days_df = tumbled_workdays_df.append(tumbled_weekends_df).sort_index()
+    gap_length_histogram = get_gap_length_histogram(get_gap_lengths(ts_df["data"]))
+    print(f'{sensor["name"]}: Gap lengths in periods {gap_length_histogram}')
+
+    print(f'{sensor["name"]}: Arranging data to days')
+    day_grid = DayGrid.from_series(ts_df["data"], period_data, dst_calendar)
 
     print(f'{sensor["name"]}: Starting to impute small gaps')
-    ts_df = impute_small_gaps(
-        ts_df,
-        period_data,
-        workdays_df,
-        tumbled_workdays_df,
-        weekends_df,
-        tumbled_weekends_df,
-    )
+    ts_df = impute_small_gaps(ts_df, day_grid, args)
 
-    # Why call separate func again? to have tumbled dataframes with imputed small gaps
-    (
-        workdays_df,
-        tumbled_workdays_df,
-        weekends_df,
-        tumbled_weekends_df,
-    ) = separate_workdays_and_weekends(ts_df[["imputed_data"]], period_data)
-    tumbled_days_with_small_gaps_fixed_df = tumbled_workdays_df.append(
-        tumbled_weekends_df
-    ).sort_index()
+    # Why refill the days? to have days with imputed small gaps
+    small_gaps_fixed_day_grid = day_grid.refill(ts_df["imputed_data"])
 
     print(f'{sensor["name"]}: Marking missing data')
-    ts_df = mark_missing_data(
-        ts_df, period_data, tumbled_days_df, tumbled_days_with_small_gaps_fixed_df
-    )
+    ts_df = mark_missing_data(ts_df, day_grid, small_gaps_fixed_day_grid)
 
     print(f'{sensor["name"]}: Starting Anomaly detection')
-    ts_df = detect_anomalies(
-        ts_df, period_data, tumbled_workdays_df, tumbled_weekends_df, sensor, args
-    )
+    ts_df = detect_anomalies(ts_df, small_gaps_fixed_day_grid, sensor, args)
 
     if args["impute_data_gaps"]:
         print(f'{sensor["name"]}: Starting to impute big gaps')
-        ts_df = impute_big_gaps(ts_df)
+        ts_df = impute_big_gaps(ts_df, day_grid)
 
+    return ts_df
+
+
+def persist(sensor, ts_df, args):
     if args["plot"]["create_plot"]:
         plot_result(ts_df, sensor, args)
 
@@ -81,18 +70,11 @@ def process(sensor, args):
         args["upload_to_c8y"]["upload_anomaly_data"]
         or args["upload_to_c8y"]["upload_imputation"]
     ):
-        batch_size = args["upload_to_c8y"]["batch_upload_size"] or 10000
-        split_ts_df = np.array_split(ts_df, range(batch_size, len(ts_df), batch_size))
-        for i, split in enumerate(split_ts_df):
-            print(
-                f'{sensor["name"]}: Starting export for batch {i+1}/{len(split_ts_df)}'
-            )
-            export_results(sensor, split, args)
-
-    end = time.time()
-    print(f'{sensor["name"]}: Total runtime for sensor is {end - begin}')
-
-    return sensor
+        print(f'{sensor["name"]}: Starting export')
+        # an interrupted export resumes from the checkpoint and the upload journal
+        save_checkpoint(sensor, ts_df, args)
+        export_results(sensor, ts_df, args)
+        remove_checkpoint(sensor, args)
 
 
 def service(args):
@@ -113,15 +95,118 @@ def service(args):
 
     sensor_list = get_sensor_list(args)
 
-    parallel_batch_size = args["devices_processed_in_parallel"] or 4
-    sensor_list = np.array_split(
-        sensor_list, range(parallel_batch_size, len(sensor_list), parallel_batch_size)
+    # largest sensors first, so that a long history does not leave the other
+    # processes idle at the end of the run
+    sensor_list = sorted(
+        sensor_list,
+        key=lambda sensor: get_input_size(sensor["source"], args),
+        reverse=True,
     )
 
-    for sensors in sensor_list:
-        with multiprocessing.Pool(processes=len(sensors)) as pool:
-            for sensor in pool.starmap(process, zip(sensors, repeat(args))):
-                print("Finished Imputing", sensor)
+    failures = run_pipeline(sensor_list, args)
 
     end = time.time()
     print(f"Total runtime of the AD service is {end - begin}")
+
+    if len(failures) != 0:
+        for sensor, exception in failures:
+            print(f'{sensor["name"]}: Failed with {exception!r}')
+        raise failures[0][1]
+
+
+def run_pipeline(sensor_list, args):
+    # loading (threads) -> analysis (processes) -> plotting and export (threads)
+    # stages are connected by bounded queues, so at most queue_size loaded and
+    # analysed sensors wait in memory while the next ones are being computed
+    pipeline_args = args.get("pipeline") or {}
+    loading_threads = pipeline_args.get("loading_threads") or 2
+    persisting_threads = pipeline_args.get("persisting_threads") or 2
+    queue_size = pipeline_args.get("queue_size") or 2
+    processes = min(args["devices_processed_in_parallel"] or 4, len(sensor_list))
+
+    sensor_queue = queue.Queue()
+    loaded_queue = queue.Queue(maxsize=queue_size)
+    analysed_queue = queue.Queue(maxsize=queue_size)
+    for sensor in sensor_list:
+        sensor_queue.put(sensor)
+
+    failures = []
+    begin_times = {}
+
+    def load_sensors():
+        while True:
+            try:
+                sensor = sensor_queue.get_nowait()
+            except queue.Empty:
+                return
+            begin_times[sensor["source"]] = time.time()
+            try:
+                ts_df = load_checkpoint(sensor, args)
+                if ts_df is not None:
+                    # analysed already, only the export is left
+                    print(f'{sensor["name"]}: Resuming from export checkpoint')
+                    analysed_queue.put((sensor, ts_df))
+                else:
+                    loaded_queue.put((sensor, load(sensor, args)))
+            except Exception as exception:
+                failures.append((sensor, exception))
+
+    def analyse_sensors(pool):
+        # one thread per process keeps every process busy
+        while True:
+            item = loaded_queue.get()
+            if item is None:
+                return
+            sensor, ts_df = item
+            try:
+                ts_df = pool.submit(analyse, sensor, ts_df, args).result()
+                analysed_queue.put((sensor, ts_df))
+            except Exception as exception:
+                failures.append((sensor, exception))
+
+    def persist_sensors():
+        while True:
+            item = analysed_queue.get()
+            if item is None:
+                return
+            sensor, ts_df = item
+            try:
+                persist(sensor, ts_df, args)
+            except Exception as exception:
+                failures.append((sensor, exception))
+                continue
+            end = time.time()
+            runtime = end - begin_times[sensor["source"]]
+            print(f'{sensor["name"]}: Total runtime for sensor is {runtime}')
+            print("Finished Imputing", sensor)
+
+    # forking while the loader threads run could copy a held lock into the
+    # analysis processes, forkserver starts them from a clean process
+    with ProcessPoolExecutor(
+        max_workers=processes, mp_context=multiprocessing.get_context("forkserver")
+    ) as pool:
+        loaders = start_threads(load_sensors, loading_threads)
+        analysers = start_threads(partial(analyse_sensors, pool), processes)
+        persisters = start_threads(persist_sensors, persisting_threads)
+
+        join_threads(loaders)
+        for _ in analysers:
+            loaded_queue.put(None)
+        join_threads(analysers)
+        for _ in persisters:
+            analysed_queue.put(None)
+        join_threads(persisters)
+
+    return failures
+
+
+def start_threads(target, amount):
+    threads = [threading.Thread(target=target) for _ in range(amount)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def join_threads(threads):
+    for thread in threads:
+        thread.join()